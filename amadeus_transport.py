@@ -0,0 +1,174 @@
+import threading
+import time
+from collections import deque
+from urllib.error import URLError
+
+import amadeus.mixins.parser
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# The Amadeus SDK defaults to urllib's urlopen, which opens a new TCP + TLS
+# connection for every request. This transport sends the SDK's requests
+# through one shared requests.Session instead, so parallel searches reuse
+# a pool of kept-alive connections. Pass it as Client(http=urlopen).
+POOL_SIZE = 32          # keep >= the widest thread pool making calls
+TIMEOUT = 30            # seconds; urlopen had no timeout at all
+_RETRY = Retry(
+    total=2,
+    backoff_factor=0.3,
+    status_forcelist=[502, 503, 504],
+    raise_on_status=False,  # hand the last response to the SDK's parser
+)
+_session = None
+_session_lock = threading.Lock()
+# Amadeus rejects bursts over its per-second limit (10 TPS on the test
+# tier) with a 429, which the app would otherwise treat as an exhausted
+# quota. The limiter keeps every request the SDK makes under RPS_CAP and
+# backs off when a 429 gets through anyway.
+RPS_CAP = 10
+THROTTLE_RETRIES = 2    # re-sends of a request that came back 429
+MAX_RETRY_AFTER = 10    # seconds; don't stall a search on a huge header
+
+
+class AmadeusLimiter:
+    """
+    Sliding one-second window of request timestamps. The allowed rate is
+    halved on every 429 or 5xx and creeps back up to RPS_CAP on successes
+    (AIMD), so a struggling backend sees less traffic from every thread.
+    """
+
+    def __init__(self, rps_cap=RPS_CAP):
+        self.rps_cap = rps_cap
+        self.rate = float(rps_cap)
+        self._sent = deque()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a request may be sent, then record it."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                while self._sent and self._sent[0] <= now - 1.0:
+                    self._sent.popleft()
+                if now < self._paused_until:
+                    wait = self._paused_until - now
+                elif len(self._sent) < int(self.rate):
+                    self._sent.append(now)
+                    return
+                else:
+                    wait = self._sent[0] + 1.0 - now
+            time.sleep(wait)
+
+    def throttled(self, retry_after=None):
+        """Back off after a 429: halve the rate and pause every caller."""
+        with self._lock:
+            self.rate = max(1.0, self.rate / 2)
+            pause = min(retry_after or 1.0, MAX_RETRY_AFTER)
+            self._paused_until = max(self._paused_until, time.monotonic() + pause)
+
+    def overloaded(self):
+        """Back off after a 5xx or connection failure that survived retries."""
+        with self._lock:
+            self.rate = max(1.0, self.rate / 2)
+
+    def succeeded(self):
+        with self._lock:
+            if self.rate < self.rps_cap:
+                # About +1 request/second for each second at the current rate
+                self.rate = min(float(self.rps_cap), self.rate + 1.0 / self.rate)
+
+
+limiter = AmadeusLimiter()
+
+
+def _retry_after(headers):
+    try:
+        return float(headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None   # absent, or an HTTP date: use the default pause
+
+
+class _Response:
+    """The parts of an urlopen() response the Amadeus SDK's parser reads."""
+    __slots__ = ("status", "code", "_headers", "_body")
+
+    def __init__(self, response):
+        self.status = self.code = response.status_code
+        self._headers = response.headers
+        self._body = response.content
+
+    def info(self):
+        return self._headers
+
+    def read(self):
+        return self._body
+
+
+def _get_session():
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=16, pool_maxsize=POOL_SIZE,
+                    max_retries=_RETRY,
+                )
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session = session
+    return _session
+
+
+def urlopen(request):
+    """
+    urlopen-compatible transport for amadeus.Client(http=...).
+    HTTP error statuses come back as responses, like urlopen's HTTPError;
+    connection failures raise URLError so the SDK reports a NetworkError.
+    A 429 is re-sent after backing off, up to THROTTLE_RETRIES times.
+    """
+    for attempt in range(THROTTLE_RETRIES + 1):
+        limiter.acquire()
+        try:
+            response = _get_session().request(
+                request.get_method(),
+                request.full_url,
+                headers=dict(request.header_items()),
+                data=request.data,
+                timeout=TIMEOUT,
+            )
+        except requests.RequestException as e:
+            limiter.overloaded()
+            raise URLError(e) from e
+        if response.status_code == 429:
+            limiter.throttled(_retry_after(response.headers))
+            continue
+        if response.status_code >= 500:
+            limiter.overloaded()
+        else:
+            limiter.succeeded()
+        break
+    return _Response(response)
+
+
+class _OrjsonModule:
+    """Stands in for the json module inside the SDK's response parser."""
+    loads = staticmethod(orjson.loads) if orjson else None
+
+
+def use_orjson_parser():
+    """
+    Make the Amadeus SDK parse response bodies with orjson, which is several
+    times faster than json.loads on large flight-offer payloads. The SDK
+    only calls json.loads there, and catches any parse error itself.
+    No-op when orjson isn't installed.
+    """
+    if orjson is not None:
+        amadeus.mixins.parser.json = _OrjsonModule
@@ -1,49 +1,395 @@
+import atexit
+import itertools
 import json
 import os
+import re
 import threading
-from datetime import datetime, timezone
+import time
+from contextlib import contextmanager
+from datetime import date
+
+try:
+    from orjson import loads as _loads
+except ImportError:
+    _loads = json.loads
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
 
 USAGE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "api_usage.json")
 DAILY_CAP = 1000
+# The in-memory record is the source of truth. The file is only written on
+# day rollover, on interpreter exit, on an explicit flush(), and — unless
+# SYNC_INTERVAL is None — at most once every SYNC_INTERVAL seconds while
+# calls are coming in. A hard crash loses at most SYNC_INTERVAL seconds of
+# counts, which is an acceptable trade for no disk I/O per call.
+SYNC_INTERVAL = 5.0
+# USAGE_FILE is an append-only JSON Lines log: a compacted
+# {"date": "YYYY-MM-DD", "calls": N} record followed by one
+# {"t": epoch_day, "n": delta} line per flush. It is folded back into a
+# single record on load (which also repairs a torn last line or a legacy
+# single-record file), on day rollover, and once it passes COMPACT_BYTES.
+COMPACT_BYTES = 64 * 1024
+# Set API_USAGE_MULTIPROC=1 when several worker processes share USAGE_FILE.
+# Each worker appends its own deltas and re-reads the total under an flock
+# on USAGE_FILE + ".lock" (compaction replaces USAGE_FILE itself). Each
+# process can overshoot DAILY_CAP by whatever the others counted in their
+# last SYNC_INTERVAL before it sees their counts.
+MULTI_PROCESS = os.environ.get("API_USAGE_MULTIPROC") == "1" and fcntl is not None
+# A worker's own count says nothing about what the others did since its
+# last sync, so in multi-process mode each worker also syncs (re-reading
+# every worker's total) once its unsynced calls reach SYNC_SHARE of the
+# headroom left at that sync. Syncs get more frequent as the shared total
+# nears DAILY_CAP, down to every call, and the overshoot stays bounded for
+# up to 1 / SYNC_SHARE workers. A single process counts exactly and never
+# needs to.
+SYNC_SHARE = 0.1
+# _lock guards loading, day rollover, flushing and multi-call adds. The
+# single-call fast path takes a number from the current _Window's
+# itertools.count (next() is atomic under the GIL) without the lock, then
+# checks the window is still current. Anything that needs the exact total
+# retires the window under _lock first (see _close_locked), and a caller
+# that raced the retirement settles its call under _lock, so no call is
+# lost or counted twice.
 _lock = threading.Lock()
+_exceeded = False       # cap reached today; short-circuits increment_usage
+_last_flush = time.monotonic()
+_fd = None              # long-lived O_APPEND handle for USAGE_FILE
+_lock_fd = None         # handle on the multi-process lock file
+# Multi-process get_usage reads other workers' counts from the file; the
+# result is reused for USAGE_TTL seconds since quota displays poll it.
+USAGE_TTL = 1.0
+_usage_cache = (float("-inf"), (0, DAILY_CAP))
+# Days are kept as ints (days since the Unix epoch, UTC) and only
+# formatted as YYYY-MM-DD when the record is written.
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+_day_str_cache = (None, "")
+# Lines are always written in exactly these shapes, so reads and writes
+# skip the general-purpose JSON machinery; anything else falls back to it.
+# Compaction reuses one buffer: the date bytes are patched in place when
+# the day changes and only the calls digits are rewritten.
+_RECORD_HEAD = b'{"date":"0000-00-00","calls":'
+_DATE_AT = slice(9, 19)
+_scratch = bytearray(_RECORD_HEAD)
+_scratch_day = None
+_RECORD_RE = re.compile(rb'\{"date":"(\d{4}-\d{2}-\d{2})","calls":(\d+)\}')
+_DELTA_TMPL = b'{"t":%d,"n":%d}\n'
+_DELTA_RE = re.compile(rb'\{"t":(\d+),"n":(\d+)\}')
+
+
+class _Usage:
+    """Today's record as last loaded or flushed; mutated in place."""
+    __slots__ = ("day", "calls")
+
+    def __init__(self):
+        self.day = None     # epoch day; None until loaded from disk
+        self.calls = 0
+
+
+_state = _Usage()
+
+
+class _Window:
+    """Calls counted lock-free on top of base; end is set once retired."""
+    __slots__ = ("counter", "base", "end")
+
+    def __init__(self, base):
+        self.counter = itertools.count()
+        self.base = base
+        self.end = None     # numbers below end were counted in this window
+
+
+_window = _Window(0)    # None while _close_locked is retiring it
+
+
+def _today_day():
+    return int(time.time()) // 86400
 
 
-def _today():
-    return datetime.now(timezone.utc).strftime("%Y-%m-%d")
+def _day_str(day):
+    """Format an epoch day as YYYY-MM-DD, caching the last result."""
+    global _day_str_cache
+    if day != _day_str_cache[0]:
+        t = time.gmtime(day * 86400)
+        _day_str_cache = (
+            day, f"{t.tm_year:04d}-{t.tm_mon:02d}-{t.tm_mday:02d}",
+        )
+    return _day_str_cache[1]
+
+
+def _parse_day(date_str):
+    return date.fromisoformat(date_str).toordinal() - _EPOCH_ORDINAL
+
+
+def _close_fd():
+    global _fd
+    if _fd is not None:
+        try:
+            os.close(_fd)
+        except OSError:
+            pass
+    _fd = None
+
+
+def _usage_fd():
+    global _fd
+    if _fd is not None and MULTI_PROCESS:
+        # Another worker may have compacted (replaced) the log
+        try:
+            if not os.path.samestat(os.fstat(_fd), os.stat(USAGE_FILE)):
+                _close_fd()
+        except FileNotFoundError:
+            _close_fd()
+    if _fd is None:
+        _fd = os.open(USAGE_FILE, os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o644)
+    return _fd
+
+
+def _parse_line(line):
+    """Return (day, calls) for a record or delta line."""
+    m = _DELTA_RE.fullmatch(line)
+    if m:
+        return int(m.group(1)), int(m.group(2))
+    m = _RECORD_RE.fullmatch(line)
+    if m:
+        return _parse_day(m.group(1).decode()), int(m.group(2))
+    data = _loads(line)
+    if "t" in data:
+        return int(data["t"]), int(data["n"])
+    return _parse_day(data["date"]), int(data["calls"])
 
 
 def _read_usage():
+    """Fold the log into (day, calls) for the latest day it covers."""
+    fd = _usage_fd()
+    os.lseek(fd, 0, os.SEEK_SET)
+    buf = os.read(fd, os.fstat(fd).st_size)
+    day, calls = None, 0
+    for line in buf.splitlines():
+        try:
+            d, n = _parse_line(line)
+        # Covers json/orjson.JSONDecodeError, torn and malformed lines
+        except (ValueError, KeyError, TypeError):
+            continue
+        if day is None or d > day:
+            day, calls = d, n
+        elif d == day:
+            calls += n
+    if day is None:
+        return _today_day(), 0
+    return day, calls
+
+
+def _append_usage(day, delta, durable=False):
+    """Append one delta line and return the log size. Caller holds _lock.
+
+    Skips fsync unless durable=True — losing the last few counts in a
+    crash is fine for a soft daily cap.
+    """
     try:
-        with open(USAGE_FILE, "r") as f:
-            return json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError):
-        return {"date": _today(), "calls": 0}
+        fd = _usage_fd()
+        os.write(fd, _DELTA_TMPL % (day, delta))
+        if durable:
+            os.fsync(fd)
+        return os.fstat(fd).st_size
+    except OSError:
+        # Stale or closed handle: reopen on the next write
+        _close_fd()
+        raise
 
 
-def _write_usage(data):
-    with open(USAGE_FILE, "w") as f:
-        json.dump(data, f)
+def _write_usage(usage, durable=False):
+    """Replace the log with a single record for usage. Caller holds _lock."""
+    global _scratch_day
+    if usage.day != _scratch_day:
+        _scratch[_DATE_AT] = _day_str(usage.day).encode()
+        _scratch_day = usage.day
+    del _scratch[len(_RECORD_HEAD):]
+    _scratch.extend(b"%d}\n" % usage.calls)
+    tmp_path = USAGE_FILE + ".tmp"
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        os.write(fd, _scratch)
+        if durable:
+            os.fsync(fd)
+    finally:
+        os.close(fd)
+    os.replace(tmp_path, USAGE_FILE)
+    # Our handle still points at the replaced file
+    _close_fd()
+
+
+@contextmanager
+def _file_lock(exclusive):
+    """Hold an flock on the lock file in multi-process mode; no-op otherwise."""
+    global _lock_fd
+    if not MULTI_PROCESS:
+        yield
+        return
+    if _lock_fd is None:
+        _lock_fd = os.open(USAGE_FILE + ".lock", os.O_RDWR | os.O_CREAT, 0o644)
+    fcntl.flock(_lock_fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+    try:
+        yield
+    finally:
+        fcntl.flock(_lock_fd, fcntl.LOCK_UN)
+
+
+def _close_locked():
+    """Retire the current window and return today's total. Caller holds _lock.
+
+    Reopen with _open_locked before releasing _lock.
+    """
+    global _window
+    window = _window
+    _window = None
+    # Taken after the swap: every caller that got a lower number is counted
+    # here, and every one that gets a higher number sees the swap and
+    # retries on the next window
+    window.end = next(window.counter)
+    return window.base + min(window.end, max(DAILY_CAP - window.base, 0))
+
+
+def _open_locked(calls):
+    global _window
+    _window = _Window(calls)
+
+
+def _reset_locked(day, calls):
+    """Start counting from calls on day. Caller must hold _lock."""
+    global _exceeded
+    _state.day = day
+    _state.calls = calls
+    _close_locked()
+    _open_locked(calls)
+    _exceeded = calls >= DAILY_CAP
+
+
+def _sync_locked(today):
+    """Load today's record or roll over to a new day. Caller must hold _lock."""
+    if _state.day == today:
+        return
+    with _file_lock(exclusive=True):
+        day, calls = _read_usage()
+        _reset_locked(today, calls if day == today else 0)
+        _write_usage(_state)
+
+
+def _flush_locked(durable=False):
+    """Write pending counts, if any. Caller holds _lock."""
+    global _last_flush, _exceeded
+    calls = _close_locked()
+    try:
+        if calls == _state.calls:
+            return
+        with _file_lock(exclusive=True):
+            size = _append_usage(_state.day, calls - _state.calls, durable)
+            _state.calls = calls
+            if MULTI_PROCESS:
+                # Resume counting from every worker's total
+                day, disk_calls = _read_usage()
+                if day == _state.day:
+                    _state.calls = calls = disk_calls
+                    _exceeded = calls >= DAILY_CAP
+            if size > COMPACT_BYTES:
+                _write_usage(_state, durable)
+        _last_flush = time.monotonic()
+    finally:
+        _open_locked(calls)
+
+
+def flush(durable=False):
+    """Write any pending counts to disk."""
+    with _lock:
+        if _state.day is not None:
+            _flush_locked(durable)
+
+
+atexit.register(flush, durable=True)
+
+
+def _maybe_flush(n):
+    """Flush if SYNC_INTERVAL has passed since the last write (n: call number)."""
+    if SYNC_INTERVAL is None:
+        return
+    if MULTI_PROCESS:
+        # _state.calls is the shared total as of this worker's last sync
+        unsynced = n - _state.calls
+        if unsynced >= max(1, (DAILY_CAP - _state.calls) * SYNC_SHARE):
+            flush()
+            return
+    if time.monotonic() - _last_flush > SYNC_INTERVAL:
+        flush()
+
+
+def _ensure_today():
+    today = _today_day()
+    if _state.day != today:
+        with _lock:
+            _sync_locked(today)
 
 
 def get_usage():
     """Return (calls_used_today, daily_cap). Resets if date changed (UTC)."""
+    global _usage_cache
+    _ensure_today()
+    if not MULTI_PROCESS:
+        with _lock:
+            calls = _close_locked()
+            _open_locked(calls)
+        return calls, DAILY_CAP
+
+    now = time.monotonic()
+    if now - _usage_cache[0] < USAGE_TTL:
+        return _usage_cache[1]
     with _lock:
-        data = _read_usage()
-        if data.get("date") != _today():
-            data = {"date": _today(), "calls": 0}
-            _write_usage(data)
-        return data["calls"], DAILY_CAP
+        calls = local = _close_locked()
+        _open_locked(local)
+        with _file_lock(exclusive=False):
+            day, disk_calls = _read_usage()
+        if day == _state.day:
+            calls = disk_calls + local - _state.calls
+    _usage_cache = (now, (calls, DAILY_CAP))
+    return _usage_cache[1]
+
+
+def _settle_locked(window, k):
+    """Call number for a fast-path call whose window was retired under it."""
+    if window is not None and k < window.end:
+        return window.base + k + 1     # counted when its window closed
+    window = _window                   # can't be retired while we hold _lock
+    return window.base + next(window.counter) + 1
 
 
 def increment_usage(count=1):
     """Add count calls. Returns True if under cap, False if cap exceeded."""
-    with _lock:
-        data = _read_usage()
-        if data.get("date") != _today():
-            data = {"date": _today(), "calls": 0}
-        if data["calls"] + count > DAILY_CAP:
-            _write_usage(data)
-            return False
-        data["calls"] += count
-        _write_usage(data)
-        return True
+    global _exceeded
+    _ensure_today()
+    if _exceeded:
+        return False
+    if count != 1:
+        with _lock:
+            calls = _close_locked()
+            allowed = calls + count <= DAILY_CAP
+            n = calls + count if allowed else calls
+            _open_locked(n)
+        if allowed:
+            _maybe_flush(n)
+        return allowed
+
+    window = _window
+    k = None
+    if window is not None:
+        k = next(window.counter)
+    if window is not None and _window is window:
+        n = window.base + k + 1
+    else:
+        with _lock:
+            n = _settle_locked(window, k)
+    if n > DAILY_CAP:
+        _exceeded = True
+        return False
+    _maybe_flush(n)
+    return True
@@ -2,6 +2,7 @@
 # Basically Zillow's "Make Me Move" but with more turbulence
 import os
 import time
+import types
 import streamlit as st
 from datetime import date, timedelta
 from flight_finder import (
@@ -12,106 +13,67 @@ from flight_finder import (
     get_hub_destinations,
     dedup_destinations,
     lookup_airlines_batch,
+    join_airline_names,
     get_deal_scores_parallel,
-    compute_deal_label,
-    predict_delay,
+    compute_deal_labels,
+    predict_delays_parallel,
     google_flights_url,
+    google_flights_urls,
     FlightSearchError,
     ApiCapExceeded,
     QuotaExhausted,
+    detect_currency,
     HUBS_BY_REGION,
-    CITY_NAMES,
+    CITY_LABELS,
 )
 from api_usage import get_usage
-from ip_limiter import check_ip_limit, get_ip_usage
-import pandas as pd
+from ip_limiter import charge_and_check, get_ip_usage
 
 st.set_page_config(page_title="Make Me Fly", page_icon="✈️", layout="wide")
 
+
+# Static files next to app.py are read once per process, not on every rerun
+@st.cache_resource(show_spinner=False)
+def load_text_file(name):
+    """Return the contents of a file next to app.py, or None if missing."""
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), name)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
 # --- Logo ---
-LOGO_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "makemefly-logo.svg")
-if os.path.exists(LOGO_PATH):
+# st.image renders SVG markup passed as a string
+logo_svg = load_text_file("makemefly-logo.svg")
+if logo_svg:
     col_l, col_logo, col_r = st.columns([1, 2, 1])
     with col_logo:
-        st.image(LOGO_PATH, use_container_width=True)
+        st.image(logo_svg, use_container_width=True)
 else:
     st.title("✈️ Make Me Fly")
     st.caption("Discover your next adventure.")
 
-# Rate limiting: because going viral should be a celebration, not a billing event
-if "search_count" not in st.session_state:
-    st.session_state.search_count = 0
-    st.session_state.search_reset = date.today()
-
-if st.session_state.search_reset < date.today():
-    st.session_state.search_count = 0
-    st.session_state.search_reset = date.today()
-
-MAX_SEARCHES_PER_DAY = 20
-
-# Amadeus test env returns prices in the origin airport's local currency,
-# not the requested currency. Map airports to their actual currency.
-AIRPORT_CURRENCY = {
-    # Canada — CAD
-    "YVR": "CAD", "YYC": "CAD", "YYZ": "CAD",
-    # United States — USD
-    "SFO": "USD", "LAX": "USD", "SEA": "USD", "PDX": "USD", "ORD": "USD",
-    "JFK": "USD", "BOS": "USD", "IAD": "USD", "ATL": "USD", "DFW": "USD",
-    "MIA": "USD", "DEN": "USD", "MSP": "USD", "EWR": "USD", "LGA": "USD",
-    "DCA": "USD", "OAK": "USD", "SJC": "USD", "BUR": "USD", "SNA": "USD",
-    "ONT": "USD", "LGB": "USD", "FLL": "USD", "MDW": "USD", "DAL": "USD",
-    "BLI": "USD", "ANC": "USD", "HNL": "USD",
-    # Europe — EUR (eurozone)
-    "CDG": "EUR", "ORY": "EUR", "AMS": "EUR", "FRA": "EUR", "MUC": "EUR",
-    "BCN": "EUR", "MAD": "EUR", "FCO": "EUR", "DUB": "EUR",
-    # Europe — non-EUR
-    "LHR": "GBP", "LGW": "GBP", "STN": "GBP", "LTN": "GBP",
-    "ZRH": "CHF",
-    "CPH": "DKK",
-    "IST": "TRY",
-    # Asia-Pacific
-    "NRT": "JPY", "HND": "JPY",
-    "ICN": "KRW",
-    "HKG": "HKD",
-    "SIN": "SGD",
-    "BKK": "THB",
-    "TPE": "TWD",
-    "PVG": "CNY", "SHA": "CNY", "PEK": "CNY", "PKX": "CNY",
-    "SYD": "AUD",
-    "AKL": "NZD",
-    "MNL": "PHP",
-    "KUL": "MYR",
-    # Mexico/Caribbean
-    "CUN": "MXN", "MEX": "MXN", "PVR": "MXN", "SJD": "MXN",
-    "MBJ": "USD", "AUA": "USD",
-    # South America
-    "GRU": "BRL", "GIG": "BRL", "CGH": "BRL",
-    "BOG": "COP", "SCL": "CLP", "LIM": "PEN", "EZE": "ARS",
-    # Africa
-    "JNB": "ZAR", "CPT": "ZAR",
-    "NBO": "KES",
-    "CAI": "EGP",
-    "ADD": "ETB",
-    # Middle East
-    "DXB": "AED", "AUH": "AED",
-    "DOH": "QAR",
-    "TLV": "ILS",
-    "AMM": "JOD",
-}
-
-
-def detect_currency(iata_code):
-    """Return the local currency for an airport code, defaulting to USD."""
-    return AIRPORT_CURRENCY.get(iata_code, "USD")
-
+# Rate limiting: because going viral should be a celebration, not a billing event.
+# Counted per client IP on the server — a session counter resets on reload.
+_headers = st.context.headers
+client_ip = (
+    _headers.get("X-Forwarded-For", "").partition(",")[0].strip()
+    or _headers.get("X-Real-Ip", "")
+    or "unknown"
+)
 
 # Cache results for 30 min because flight prices don't change that fast
-# and my Amadeus free tier definitely does run out that fast
-@st.cache_data(ttl=1800, show_spinner=False)
+# and my Amadeus free tier definitely does run out that fast.
+# cache_resource hands back the stored object instead of hashing and
+# unpickling a copy on every hit, so results are shared across sessions and
+# wrapped read-only — the render code below only ever reads them.
+@st.cache_resource(ttl=1800, show_spinner=False)
 def run_search(origin, dep_str, ret_str, cabins_tuple, dest_tuple, currency,
                nonstop, max_price):
     """Cached parallel search. Results stored for 30 minutes."""
-    return search_parallel(
+    return types.MappingProxyType(search_parallel(
         origin=origin,
         destinations=list(dest_tuple),
         departure_date=dep_str,
@@ -120,14 +82,14 @@ def run_search(origin, dep_str, ret_str, cabins_tuple, dest_tuple, currency,
         currency=currency,
         nonstop=nonstop,
         max_price=max_price,
-    )
+    ))
 
 
-@st.cache_data(ttl=1800, show_spinner=False)
+@st.cache_resource(ttl=1800, show_spinner=False)
 def run_flexible_search(origin, sample_dates_tuple, trip_length, cabins_tuple,
                         dest_tuple, currency, nonstop, max_price):
     """Cached flexible date search. Results stored for 30 minutes."""
-    return search_flexible(
+    return types.MappingProxyType(search_flexible(
         origin=origin,
         destinations=list(dest_tuple),
         sample_dep_dates=list(sample_dates_tuple),
@@ -136,7 +98,44 @@ def run_flexible_search(origin, sample_dates_tuple, trip_length, cabins_tuple,
         currency=currency,
         nonstop=nonstop,
         max_price=max_price,
-    )
+    ))
+
+
+# Hashed on the table's contents, so each result table is serialized once
+# however many times the page reruns while showing it
+@st.cache_data(max_entries=32, show_spinner=False)
+def df_to_csv(df):
+    """CSV bytes for a download button."""
+    return df.to_csv(index=False, lineterminator="\n").encode("utf-8")
+
+
+# A search builds a list of (kind, ...) items once; render_results replays
+# it from session_state. Sidebar changes rerun the script without redoing
+# the search or rebuilding tables, and as a fragment, download clicks only
+# rerun this function.
+@st.fragment
+def render_results(view):
+    """Render a stored search result view."""
+    for kind, *args in view:
+        if kind == "table":
+            df, download_label, file_name = args
+            col_config = {}
+            if "Book" in df.columns:
+                col_config["Book"] = st.column_config.LinkColumn(
+                    "Book", display_text="Book ➜"
+                )
+            st.dataframe(
+                df, column_config=col_config,
+                use_container_width=True, hide_index=True,
+            )
+            st.download_button(
+                label=download_label,
+                data=df_to_csv(df),
+                file_name=file_name,
+                mime="text/csv",
+            )
+        else:
+            getattr(st, kind)(*args)
 
 
 # --- Sidebar: Search Parameters ---
@@ -186,15 +185,14 @@ with st.sidebar:
         trip_length = st.selectbox(
             "Trip length (days)", [3, 5, 7, 10, 14], index=2,
         )
-        # Sample dates: 1st, 8th, 15th, 22nd — skip past dates
-        sample_dates = []
-        for day in [1, 8, 15, 22]:
-            try:
-                d = date(flex_month.year, flex_month.month, day)
-            except ValueError:
-                continue
-            if d > today:
-                sample_dates.append(d.strftime("%Y-%m-%d"))
+        # Sample dates: 1st, 8th, 15th, 22nd — skip past dates.
+        # Every month has a 22nd, so these are always valid dates.
+        first_of_month = flex_month.replace(day=1)
+        sample_dates = [
+            d.isoformat()
+            for d in (first_of_month + timedelta(days=n) for n in (0, 7, 14, 21))
+            if d > today
+        ]
         st.warning(
             "Flexible search checks 4 dates per destination "
             "— uses ~4× more API calls than fixed date search."
@@ -239,7 +237,8 @@ with st.sidebar:
                             help=f"Auto-detected: {detected_currency} "
                                  f"(based on {fly_from})")
 
-    remaining = MAX_SEARCHES_PER_DAY - st.session_state.search_count
+    searches_used, searches_cap = get_ip_usage(client_ip)
+    remaining = searches_cap - searches_used
     st.caption(f"Searches remaining today: {remaining}")
 
     # API usage display
@@ -263,28 +262,34 @@ else:
 
 # --- Main: Results ---
 if search and not date_error:
-    # Get client IP for rate limiting
-    _headers = st.context.headers
-    client_ip = (
-        _headers.get("X-Forwarded-For", "").split(",")[0].strip()
-        or _headers.get("X-Real-Ip", "")
-        or "unknown"
-    )
+    # Only the results need pandas; sidebar-only runs skip its import cost.
+    # Later runs get the cached module from sys.modules.
+    import pandas as pd
 
-    # Check IP rate limit
-    if not check_ip_limit(client_ip):
+    # A new search replaces the last one's results, even if it fails
+    st.session_state.pop("results_view", None)
+    view = []
+
+    # Check the IP limit and the API cap in one go
+    allowed, remaining, retry_after = charge_and_check(client_ip)
+    if not allowed and remaining is None:
+        st.warning(
+            "Make Me Fly is very busy right now. "
+            f"Please try your search again in {retry_after} seconds."
+        )
+        st.stop()
+
+    if not allowed and remaining <= 0:
+        hours, minutes = divmod(retry_after // 60, 60)
         st.error(
             "You've reached the daily search limit. "
             "Make Me Fly limits searches per user to keep the service "
             "free for everyone. Please try again tomorrow."
         )
+        st.caption(f"Limit resets in {hours}h {minutes}m (midnight UTC).")
         st.stop()
 
-    st.session_state.search_count += 1
-
-    # Check API cap before starting
-    calls_now, cap = get_usage()
-    if calls_now >= cap:
+    if not allowed:
         st.error(
             "Make Me Fly has been really popular today! "
             "To keep this free tool running, we limit daily searches. "
@@ -297,6 +302,8 @@ if search and not date_error:
                 dest_list = get_hub_destinations(regions)
             else:
                 with st.spinner("Loading destinations..."):
+                    # Cached in flight_finder for every session; no second
+                    # layer here, so that cache's TTL is the one in effect
                     dest_list = get_direct_destinations(fly_from)
         except FlightSearchError as e:
             st.error(e.message)
@@ -306,9 +313,8 @@ if search and not date_error:
         dest_list = [d for d in dest_list if d != fly_from]
 
         if not dest_list:
-            if not isinstance(dest_list, list) or len(dest_list) == 0:
-                st.warning("No destinations found. Try a different origin "
-                           "or search mode.")
+            view.append(("warning", "No destinations found. Try a different "
+                                    "origin or search mode."))
 
         elif date_mode == "Flexible dates (find cheapest days)":
             # ----- FLEXIBLE DATE SEARCH -----
@@ -316,7 +322,6 @@ if search and not date_error:
             n_dates = len(sample_dates)
             n_calls = n_dests * len(cabins) * n_dates
 
-            timer_slot = st.empty()
             start_time = time.time()
 
             try:
@@ -355,45 +360,51 @@ if search and not date_error:
                 len(dests) > 0 for dests in flex_results.values()
             )
             if not has_results:
-                timer_slot.empty()
-                st.info(
-                    "No flights found. Try a different month, "
-                    "a larger search, or disable nonstop."
-                )
+                view.append(("info",
+                             "No flights found. Try a different month, "
+                             "a larger search, or disable nonstop."))
             else:
                 if elapsed < 1.0:
-                    timer_slot.caption("⚡ Results loaded from cache")
+                    view.append(("caption", "⚡ Results loaded from cache"))
                 else:
-                    timer_slot.caption(
-                        f"⏱ Results found in {elapsed:.1f} seconds "
-                        f"({n_dests} destinations × {n_dates} dates)"
-                    )
+                    view.append(("caption",
+                                 f"⏱ Results found in {elapsed:.1f} seconds "
+                                 f"({n_dests} destinations × {n_dates} dates)"))
 
-                st.caption(
-                    "Prices shown in the local currency of your "
-                    "departure airport."
-                )
+                view.append(("caption",
+                             "Prices shown in the local currency of your "
+                             "departure airport."))
 
                 # Collect carrier codes for airline lookup
-                all_carrier_codes = set()
-                for cab_dests in flex_results.values():
-                    for info in cab_dests.values():
-                        flight = info["flight"]
-                        for seg in flight["itineraries"][0]["segments"]:
-                            all_carrier_codes.add(seg["carrierCode"])
+                all_carrier_codes = {
+                    seg["carrierCode"]
+                    for cab_dests in flex_results.values()
+                    for info in cab_dests.values()
+                    for seg in info["flight"]["itineraries"][0]["segments"]
+                }
 
                 try:
                     airline_names = lookup_airlines_batch(all_carrier_codes)
                 except FlightSearchError:
                     airline_names = {c: c for c in all_carrier_codes}
+                airlines_by_dest = join_airline_names(
+                    {
+                        (cab, dest): info["flight"]
+                        for cab, cab_dests in flex_results.items()
+                        for dest, info in cab_dests.items()
+                    },
+                    airline_names,
+                )
 
                 # Display per cabin
                 for cabin_name in cabins:
                     cab_dests = flex_results.get(cabin_name, {})
-                    st.subheader(f"{cabin_name.title()} Class — Best Dates")
+                    view.append(("subheader",
+                                 f"{cabin_name.title()} Class — Best Dates"))
 
                     if not cab_dests:
-                        st.info(f"No {cabin_name.lower()} flights found.")
+                        view.append(("info",
+                                     f"No {cabin_name.lower()} flights found."))
                         continue
 
                     sorted_dests = sorted(
@@ -401,85 +412,69 @@ if search and not date_error:
                         key=lambda x: x[1]["price"],
                     )
 
-                    rows = []
+                    # Build the table column by column and format in bulk
+                    dest_labels, best_dates, return_dates = [], [], []
+                    prices, savings, flight_nums = [], [], []
+                    airlines, stops, durations, book_urls = [], [], [], []
                     for dest, info in sorted_dests:
                         flight = info["flight"]
                         segments = flight["itineraries"][0]["segments"]
-                        flight_nums = ", ".join(
+                        flight_nums.append(", ".join(
                             f"{s['carrierCode']} {s['number']}"
                             for s in segments
+                        ))
+                        airlines.append(
+                            airlines_by_dest[(cabin_name, dest)]
                         )
-                        airlines = ", ".join(sorted(set(
-                            airline_names.get(
-                                s["carrierCode"], s["carrierCode"]
-                            )
-                            for s in segments
-                        )))
-                        stops = len(segments) - 1
-                        duration = flight["itineraries"][0].get(
-                            "duration", ""
+                        stops.append(len(segments) - 1)
+                        durations.append(
+                            flight["itineraries"][0].get("duration", "")
                         )
                         best_date = info["date"]
-                        ret_dt = (
+                        best_dates.append(best_date)
+                        return_dates.append(
                             date.fromisoformat(best_date)
                             + timedelta(days=trip_length)
                         )
-                        book_url = google_flights_url(
+                        book_urls.append(google_flights_url(
                             fly_from, dest, best_date, cabin_name
-                        )
+                        ))
 
-                        city = CITY_NAMES.get(dest)
-                        dest_label = (
-                            "%s (%s)" % (city, dest) if city else dest
+                        dest_labels.append(CITY_LABELS.get(dest, dest))
+                        prices.append(info["price"])
+                        savings.append(
+                            info["savings"]
+                            if info["dates_checked"] > 1 else 0
                         )
 
-                        if (info["dates_checked"] > 1
-                                and info["savings"] > 0):
-                            savings_str = f"Save ${info['savings']:,.0f}"
-                        else:
-                            savings_str = "\u2014"
-
-                        row = {
-                            "Destination": dest_label,
-                            "Best Date": best_date,
-                            "Return": ret_dt.strftime("%Y-%m-%d"),
-                            "Price": f"${info['price']:,.0f} {currency}",
-                            "Savings": savings_str,
-                            "Flight": flight_nums,
-                            "Airlines": airlines,
-                            "Stops": stops,
-                            "Duration": duration.replace(
-                                "PT", ""
-                            ).lower(),
-                            "Book": book_url,
-                        }
-                        rows.append(row)
-
-                    df = pd.DataFrame(rows)
-
-                    col_config = {
-                        "Book": st.column_config.LinkColumn(
-                            "Book", display_text="Book ➜"
+                    df = pd.DataFrame({
+                        "Destination": dest_labels,
+                        "Best Date": best_dates,
+                        "Return": pd.to_datetime(return_dates).strftime(
+                            "%Y-%m-%d"
                         ),
-                    }
-                    st.dataframe(
-                        df, column_config=col_config,
-                        use_container_width=True, hide_index=True,
-                    )
-
-                    csv_data = df.to_csv(index=False)
-                    st.download_button(
-                        label=(
-                            f"📥 Download {cabin_name.title()} "
-                            f"flexible results as CSV"
+                        "Price": pd.Series(prices).map(
+                            lambda p: f"${p:,.0f} {currency}"
                         ),
-                        data=csv_data,
-                        file_name=(
-                            f"makemefly_flex_{cabin_name.lower()}"
-                            f"_{fly_from}_{flex_month.strftime('%Y%m')}.csv"
+                        "Savings": pd.Series(savings).map(
+                            lambda s: f"Save ${s:,.0f}" if s > 0
+                            else "\u2014"
                         ),
-                        mime="text/csv",
-                    )
+                        "Flight": flight_nums,
+                        "Airlines": airlines,
+                        "Stops": stops,
+                        "Duration": pd.Series(durations).str.replace(
+                            "PT", "", regex=False
+                        ).str.lower(),
+                        "Book": book_urls,
+                    })
+                    view.append((
+                        "table", df,
+                        f"📥 Download {cabin_name.title()} "
+                        f"flexible results as CSV",
+                        f"makemefly_flex_{cabin_name.lower()}"
+                        f"_{fly_from}_{flex_month.strftime('%Y%m')}.csv",
+                    ))
 
                 # Upgrade value analysis for flexible results
                 if ("ECONOMY" in flex_results
@@ -496,19 +491,13 @@ if search and not date_error:
                     }
                     comparisons = compute_upgrade_value(upgrade_input)
                     if comparisons:
-                        st.subheader("💎 Upgrade Value Analysis")
-                        st.caption(
-                            "Lower multiplier = "
-                            "better deal on business class"
-                        )
+                        view.append(("subheader", "💎 Upgrade Value Analysis"))
+                        view.append(("caption",
+                                     "Lower multiplier = "
+                                     "better deal on business class"))
                         comp_df = pd.DataFrame([{
-                            "Destination": (
-                                "%s (%s)" % (
-                                    CITY_NAMES[c["destination"]],
-                                    c["destination"],
-                                )
-                                if c["destination"] in CITY_NAMES
-                                else c["destination"]
+                            "Destination": CITY_LABELS.get(
+                                c["destination"], c["destination"]
                             ),
                             f"Economy ({currency})":
                                 f"${c['economy']:,.0f}",
@@ -518,23 +507,12 @@ if search and not date_error:
                             "Multiplier":
                                 f"{c['multiplier']:.1f}x",
                         } for c in comparisons])
-                        st.dataframe(
-                            comp_df, use_container_width=True,
-                            hide_index=True,
-                        )
-
-                        csv_data = comp_df.to_csv(index=False)
-                        st.download_button(
-                            label=(
-                                "📥 Download upgrade analysis as CSV"
-                            ),
-                            data=csv_data,
-                            file_name=(
-                                f"makemefly_upgrade_{fly_from}"
-                                f"_{flex_month.strftime('%Y%m')}.csv"
-                            ),
-                            mime="text/csv",
-                        )
+                        view.append((
+                            "table", comp_df,
+                            "📥 Download upgrade analysis as CSV",
+                            f"makemefly_upgrade_{fly_from}"
+                            f"_{flex_month.strftime('%Y%m')}.csv",
+                        ))
 
         else:
             # ----- FIXED DATE SEARCH (existing behavior) -----
@@ -544,7 +522,6 @@ if search and not date_error:
             n_calls = n_dests * len(cabins)
 
             # Search with timer
-            timer_slot = st.empty()
             start_time = time.time()
 
             try:
@@ -575,51 +552,57 @@ if search and not date_error:
             elapsed = time.time() - start_time
 
             if not results or all(len(v) == 0 for v in results.values()):
-                timer_slot.empty()
-                st.info(
-                    "No flights found. Try different dates, "
-                    "a larger search, or disable nonstop."
-                )
+                view.append(("info",
+                             "No flights found. Try different dates, "
+                             "a larger search, or disable nonstop."))
             else:
                 if elapsed < 1.0:
-                    timer_slot.caption("⚡ Results loaded from cache")
+                    view.append(("caption", "⚡ Results loaded from cache"))
                 else:
-                    timer_slot.caption(
-                        f"⏱ Results found in {elapsed:.1f} seconds "
-                        f"({n_dests} destinations)"
-                    )
+                    view.append(("caption",
+                                 f"⏱ Results found in {elapsed:.1f} seconds "
+                                 f"({n_dests} destinations)"))
 
-                st.caption(
-                    "Prices shown in the local currency of your "
-                    "departure airport."
-                )
+                view.append(("caption",
+                             "Prices shown in the local currency of your "
+                             "departure airport."))
 
                 # --- Enrich results ---
 
                 # 1. Collect all carrier codes for airline name lookup
-                all_carrier_codes = set()
-                for flights in results.values():
-                    for f in flights:
-                        for seg in f["itineraries"][0]["segments"]:
-                            all_carrier_codes.add(seg["carrierCode"])
+                all_carrier_codes = {
+                    seg["carrierCode"]
+                    for flights in results.values()
+                    for f in flights
+                    for seg in f["itineraries"][0]["segments"]
+                }
 
                 try:
                     airline_names = lookup_airlines_batch(all_carrier_codes)
                 except FlightSearchError:
                     airline_names = {c: c for c in all_carrier_codes}
 
-                # 2. Dedup: cheapest per destination per cabin
+                # 2. Dedup: cheapest per destination per cabin.
+                # search_parallel returns each cabin sorted by price, so the
+                # first flight seen for a destination is its cheapest.
                 deduped_results = {}
                 for cabin_name, flights in results.items():
                     cheapest = {}
                     for f in flights:
-                        segs = f["itineraries"][0]["segments"]
-                        dest = segs[-1]["arrival"]["iataCode"]
-                        price = float(f["price"]["grandTotal"])
-                        if dest not in cheapest or price < cheapest[dest][1]:
-                            cheapest[dest] = (f, price)
+                        dest = f["_dest"]
+                        if dest not in cheapest:
+                            cheapest[dest] = (f, f["_price_f"])
                     deduped_results[cabin_name] = cheapest
 
+                airlines_by_dest = join_airline_names(
+                    {
+                        (cabin_name, dest): f
+                        for cabin_name, cheapest in deduped_results.items()
+                        for dest, (f, _price) in cheapest.items()
+                    },
+                    airline_names,
+                )
+
                 # 3. Collect unique destinations for deal scores
                 unique_dests = set()
                 for cheapest in deduped_results.values():
@@ -637,87 +620,89 @@ if search and not date_error:
                 if show_delays:
                     delay_status = st.empty()
                     delay_status.text("Fetching on-time predictions...")
-                    for cabin_name, cheapest in deduped_results.items():
-                        for dest, (flight, _price) in cheapest.items():
-                            key = (cabin_name, dest)
-                            seg = flight["itineraries"][0]["segments"][0]
-                            delay_results[key] = predict_delay(seg) or "N/A"
+                    delay_segments = {
+                        (cabin_name, dest):
+                            flight["itineraries"][0]["segments"][0]
+                        for cabin_name, cheapest in deduped_results.items()
+                        for dest, (flight, _price) in cheapest.items()
+                    }
+                    delay_results = {
+                        key: prediction or "N/A"
+                        for key, prediction in
+                        predict_delays_parallel(delay_segments).items()
+                    }
                     delay_status.empty()
 
                 # --- Display results per cabin ---
                 for cabin_name, cheapest in deduped_results.items():
-                    st.subheader(f"{cabin_name.title()} Class")
+                    view.append(("subheader", f"{cabin_name.title()} Class"))
 
                     if not cheapest:
-                        st.info(f"No {cabin_name.lower()} flights found.")
+                        view.append(("info",
+                                     f"No {cabin_name.lower()} flights found."))
                         continue
 
                     sorted_dests = sorted(
                         cheapest.items(), key=lambda x: x[1][1]
                     )
 
-                    rows = []
+                    # Build the table column by column and format in bulk
+                    dest_labels, prices, departures = [], [], []
+                    flight_nums, airlines, stops, durations = [], [], [], []
+                    on_time = []
                     for dest, (f, price_val) in sorted_dests:
                         segments = f["itineraries"][0]["segments"]
-                        flight_nums = ", ".join(
+                        flight_nums.append(", ".join(
                             f"{s['carrierCode']} {s['number']}"
                             for s in segments
+                        ))
+                        airlines.append(
+                            airlines_by_dest[(cabin_name, dest)]
                         )
-                        airlines = ", ".join(sorted(set(
-                            airline_names.get(s["carrierCode"], s["carrierCode"])
-                            for s in segments
-                        )))
-                        stops = len(segments) - 1
-                        duration = f["itineraries"][0].get("duration", "")
-                        deal_label = compute_deal_label(
-                            price_val, deal_data.get(dest)
-                        )
-                        book_url = google_flights_url(
-                            fly_from, dest, dep_str, cabin_name
+                        stops.append(len(segments) - 1)
+                        durations.append(
+                            f["itineraries"][0].get("duration", "")
                         )
 
-                        city = CITY_NAMES.get(dest)
-                        dest_label = "%s (%s)" % (city, dest) if city else dest
-
-                        row = {
-                            "Destination": dest_label,
-                            "Price": f"${price_val:,.0f} {currency}",
-                            "Deal": deal_label,
-                            "Departure": segments[0]["departure"]["at"][:10],
-                            "Flight": flight_nums,
-                            "Airlines": airlines,
-                            "Stops": stops,
-                            "Duration": duration.replace("PT", "").lower(),
-                        }
+                        dest_labels.append(CITY_LABELS.get(dest, dest))
+                        prices.append(price_val)
+                        departures.append(segments[0]["departure"]["at"][:10])
 
                         if show_delays:
                             key = (cabin_name, dest)
-                            row["On-Time"] = delay_results.get(key, "N/A")
+                            on_time.append(delay_results.get(key, "N/A"))
 
-                        row["Book"] = book_url
-                        rows.append(row)
-
-                    df = pd.DataFrame(rows)
+                    deal_labels = compute_deal_labels(
+                        prices, [deal_data.get(d) for d, _ in sorted_dests]
+                    )
 
-                    col_config = {
-                        "Book": st.column_config.LinkColumn(
-                            "Book", display_text="Book ➜"
+                    columns = {
+                        "Destination": dest_labels,
+                        "Price": pd.Series(prices).map(
+                            lambda p: f"${p:,.0f} {currency}"
                         ),
+                        "Deal": deal_labels,
+                        "Departure": departures,
+                        "Flight": flight_nums,
+                        "Airlines": airlines,
+                        "Stops": stops,
+                        "Duration": pd.Series(durations).str.replace(
+                            "PT", "", regex=False
+                        ).str.lower(),
                     }
-                    st.dataframe(
-                        df, column_config=col_config,
-                        use_container_width=True, hide_index=True,
-                    )
-
-                    # CSV download
-                    csv_data = df.to_csv(index=False)
-                    st.download_button(
-                        label=f"📥 Download {cabin_name.title()} results as CSV",
-                        data=csv_data,
-                        file_name=(f"makemefly_{cabin_name.lower()}"
-                                   f"_{fly_from}_{dep_str}.csv"),
-                        mime="text/csv",
+                    if show_delays:
+                        columns["On-Time"] = on_time
+                    columns["Book"] = google_flights_urls(
+                        fly_from, [d for d, _ in sorted_dests], dep_str,
+                        cabin_name,
                     )
+                    df = pd.DataFrame(columns)
+                    view.append((
+                        "table", df,
+                        f"📥 Download {cabin_name.title()} results as CSV",
+                        f"makemefly_{cabin_name.lower()}"
+                        f"_{fly_from}_{dep_str}.csv",
+                    ))
 
                 # --- Upgrade value analysis ---
                 if "ECONOMY" in deduped_results and "BUSINESS" in deduped_results:
@@ -731,16 +716,13 @@ if search and not date_error:
 
                     comparisons = compute_upgrade_value(upgrade_input)
                     if comparisons:
-                        st.subheader("💎 Upgrade Value Analysis")
-                        st.caption(
-                            "Lower multiplier = "
-                            "better deal on business class"
-                        )
+                        view.append(("subheader", "💎 Upgrade Value Analysis"))
+                        view.append(("caption",
+                                     "Lower multiplier = "
+                                     "better deal on business class"))
                         comp_df = pd.DataFrame([{
-                            "Destination": (
-                                "%s (%s)" % (CITY_NAMES[c["destination"]], c["destination"])
-                                if c["destination"] in CITY_NAMES
-                                else c["destination"]
+                            "Destination": CITY_LABELS.get(
+                                c["destination"], c["destination"]
                             ),
                             f"Economy ({currency})":
                                 f"${c['economy']:,.0f}",
@@ -749,29 +731,24 @@ if search and not date_error:
                             "Premium": f"${c['premium']:,.0f}",
                             "Multiplier": f"{c['multiplier']:.1f}x",
                         } for c in comparisons])
-                        st.dataframe(
-                            comp_df, use_container_width=True,
-                            hide_index=True,
-                        )
+                        view.append((
+                            "table", comp_df,
+                            "📥 Download upgrade analysis as CSV",
+                            f"makemefly_upgrade_{fly_from}_{dep_str}.csv",
+                        ))
 
-                        csv_data = comp_df.to_csv(index=False)
-                        st.download_button(
-                            label="📥 Download upgrade analysis as CSV",
-                            data=csv_data,
-                            file_name=f"makemefly_upgrade_{fly_from}_{dep_str}.csv",
-                            mime="text/csv",
-                        )
+    st.session_state.results_view = view
+
+if st.session_state.get("results_view"):
+    render_results(st.session_state.results_view)
 
 # Yes, the 3 Diet Cokes in the footer is real. It was actually 4.
 st.divider()
 with st.expander("Privacy Policy"):
-    privacy_path = os.path.join(
-        os.path.dirname(os.path.abspath(__file__)), "PRIVACY.md"
-    )
-    try:
-        with open(privacy_path, "r") as f:
-            st.markdown(f.read())
-    except FileNotFoundError:
+    privacy_md = load_text_file("PRIVACY.md")
+    if privacy_md is not None:
+        st.markdown(privacy_md)
+    else:
         st.write("Privacy policy not found.")
 st.caption(
     "Make Me Fly — Built with Claude Code + Amadeus GDS API + 3 Diet Cokes"
@@ -0,0 +1,142 @@
+import inspect
+import itertools
+import logging
+import threading
+import time
+from concurrent.futures import Future
+from functools import wraps
+
+# In-process TTL cache for Amadeus lookups whose answers change slowly.
+# A hit returns without calling the wrapped function, so it costs no API
+# quota (the _check_cap() inside is skipped too). Entries are shared between
+# threads and Streamlit sessions: treat cached values as read-only.
+
+_MISSING = object()
+log = logging.getLogger("makemefly.cache")
+# Each cache logs its hit/miss/stale counts every STATS_EVERY lookups.
+# "stale" counts misses on an entry that had expired: a high share means
+# a longer TTL would have served those calls, a low one that it wouldn't.
+STATS_EVERY = 100
+
+
+class CacheEntry:
+    __slots__ = ("value", "timestamp", "ttl")
+
+    def __init__(self, value, ttl):
+        self.value = value
+        self.timestamp = time.monotonic()
+        self.ttl = ttl
+
+    def is_expired(self, now=None):
+        if now is None:
+            now = time.monotonic()
+        return now - self.timestamp > self.ttl
+
+
+class TTLCache:
+    """Thread-safe dict with per-entry expiry; evicts the oldest when full."""
+
+    def __init__(self, max_size=256, default_ttl=3600):
+        self.max_size = max_size
+        self.default_ttl = default_ttl
+        self._entries = {}   # insertion order == timestamp order
+        self._lock = threading.RLock()
+        self.hits = self.misses = self.stale = 0
+
+    def get(self, key, default=None, record=True):
+        """Return the live value for key, or default; record=False skips stats."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += record
+                return default
+            if entry.is_expired():
+                del self._entries[key]
+                self.misses += record
+                self.stale += record
+                return default
+            self.hits += record
+            return entry.value
+
+    def stats(self):
+        """Return {"hits", "misses", "stale", "size"} counts."""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses,
+                    "stale": self.stale, "size": len(self._entries)}
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            # Re-insert so the dict stays ordered by timestamp
+            self._entries.pop(key, None)
+            self._entries[key] = CacheEntry(
+                value, self.default_ttl if ttl is None else ttl
+            )
+            while len(self._entries) > self.max_size:
+                del self._entries[next(iter(self._entries))]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def ttl_cache(ttl, max_size=256):
+    """
+    Memoize a function on its arguments for ttl seconds. None results and
+    exceptions are not cached, so failed lookups are retried next call.
+    Concurrent calls that miss on the same arguments share one call: the
+    first runs it and the rest wait for its result (or its exception).
+    The cache is exposed as wrapper.cache.
+    """
+    def decorator(func):
+        cache = TTLCache(max_size=max_size, default_ttl=ttl)
+        # next() on an itertools.count is atomic under the GIL, so lookups
+        # from the shared thread pools are all counted
+        lookups = itertools.count(1)
+        signature = inspect.signature(func)
+        in_flight = {}          # key -> Future of the call being made
+        in_flight_lock = threading.Lock()
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            # Bind defaults so f("YVR") and f(origin="YVR") share an entry
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            key = tuple(bound.arguments.items())
+            value = cache.get(key, _MISSING)
+            if next(lookups) % STATS_EVERY == 0:
+                log.info("%s cache %s", func.__name__, cache.stats())
+            if value is not _MISSING:
+                return value
+
+            with in_flight_lock:
+                # The previous leader may have filled the cache meanwhile
+                value = cache.get(key, _MISSING, record=False)
+                if value is not _MISSING:
+                    return value
+                future = in_flight.get(key)
+                leader = future is None
+                if leader:
+                    future = in_flight[key] = Future()
+            if not leader:
+                return future.result()
+
+            try:
+                value = func(*args, **kwargs)
+            except BaseException as e:
+                future.set_exception(e)
+                raise
+            else:
+                if value is not None:
+                    cache.set(key, value)
+                future.set_result(value)
+                return value
+            finally:
+                with in_flight_lock:
+                    del in_flight[key]
+
+        wrapper.cache = cache
+        return wrapper
+    return decorator
@@ -1,9 +1,16 @@
 # Built by a GRC professional who is hoping if she gets replaced by AI,
 # at least she can fly somewhere cheap
 # Powered by Claude Code, Amadeus, and an unreasonable amount of Diet Coke
+import heapq
+import json
 import logging
 import os
+import re
+import threading
 from concurrent.futures import ThreadPoolExecutor, as_completed
+from itertools import chain
+from urllib.parse import quote
+import numpy as np
 from amadeus import Client, ResponseError
 from amadeus.client.errors import (
     AuthenticationError,
@@ -14,6 +21,8 @@ from amadeus.client.errors import (
 )
 from dotenv import load_dotenv
 from api_usage import increment_usage, get_usage
+import amadeus_transport
+from flight_cache import TTLCache, ttl_cache
 
 load_dotenv()
 
@@ -28,7 +37,9 @@ if not _client_id or not _client_secret:
 amadeus = Client(
     client_id=_client_id,
     client_secret=_client_secret,
+    http=amadeus_transport.urlopen,
 )
+amadeus_transport.use_orjson_parser()
 
 log = logging.getLogger("makemefly.api")
 logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(message)s")
@@ -108,6 +119,9 @@ CITY_NAMES = {
     "TLV": "Tel Aviv", "AMM": "Amman",
 }
 
+# Display labels like "Tokyo (NRT)"; look up with CITY_LABELS.get(code, code)
+CITY_LABELS = {code: "%s (%s)" % (city, code) for code, city in CITY_NAMES.items()}
+
 SAME_CITY_SKIP = {
     "HND": "NRT",   # Tokyo
     "ORY": "CDG",   # Paris
@@ -132,6 +146,56 @@ SAME_CITY_SKIP = {
     "SHA": "PVG",   # Shanghai
 }
 
+# Amadeus test env returns prices in the origin airport's local currency,
+# not the requested currency. Map airports to their actual currency.
+AIRPORT_CURRENCY = {
+    # Canada — CAD
+    "YVR": "CAD", "YYC": "CAD", "YYZ": "CAD",
+    # United States — USD
+    "SFO": "USD", "LAX": "USD", "SEA": "USD", "PDX": "USD", "ORD": "USD",
+    "JFK": "USD", "BOS": "USD", "IAD": "USD", "ATL": "USD", "DFW": "USD",
+    "MIA": "USD", "DEN": "USD", "MSP": "USD", "EWR": "USD", "LGA": "USD",
+    "DCA": "USD", "OAK": "USD", "SJC": "USD", "BUR": "USD", "SNA": "USD",
+    "ONT": "USD", "LGB": "USD", "FLL": "USD", "MDW": "USD", "DAL": "USD",
+    "BLI": "USD", "ANC": "USD", "HNL": "USD",
+    # Europe — EUR (eurozone)
+    "CDG": "EUR", "ORY": "EUR", "AMS": "EUR", "FRA": "EUR", "MUC": "EUR",
+    "BCN": "EUR", "MAD": "EUR", "FCO": "EUR", "DUB": "EUR",
+    # Europe — non-EUR
+    "LHR": "GBP", "LGW": "GBP", "STN": "GBP", "LTN": "GBP",
+    "ZRH": "CHF",
+    "CPH": "DKK",
+    "IST": "TRY",
+    # Asia-Pacific
+    "NRT": "JPY", "HND": "JPY",
+    "ICN": "KRW",
+    "HKG": "HKD",
+    "SIN": "SGD",
+    "BKK": "THB",
+    "TPE": "TWD",
+    "PVG": "CNY", "SHA": "CNY", "PEK": "CNY", "PKX": "CNY",
+    "SYD": "AUD",
+    "AKL": "NZD",
+    "MNL": "PHP",
+    "KUL": "MYR",
+    # Mexico/Caribbean
+    "CUN": "MXN", "MEX": "MXN", "PVR": "MXN", "SJD": "MXN",
+    "MBJ": "USD", "AUA": "USD",
+    # South America
+    "GRU": "BRL", "GIG": "BRL", "CGH": "BRL",
+    "BOG": "COP", "SCL": "CLP", "LIM": "PEN", "EZE": "ARS",
+    # Africa
+    "JNB": "ZAR", "CPT": "ZAR",
+    "NBO": "KES",
+    "CAI": "EGP",
+    "ADD": "ETB",
+    # Middle East
+    "DXB": "AED", "AUH": "AED",
+    "DOH": "QAR",
+    "TLV": "ILS",
+    "AMM": "JOD",
+}
+
 
 # ---------------------------------------------------------------------------
 # Error handling
@@ -208,6 +272,8 @@ def _check_cap():
 # Core API functions — where dreams become HTTP requests
 # ---------------------------------------------------------------------------
 
+# Route maps and price history move slowly, and each miss costs quota
+@ttl_cache(ttl=6 * 3600)
 def get_direct_destinations(origin="YVR"):
     """Get all airports with direct flights from origin."""
     _check_cap()
@@ -222,6 +288,11 @@ def get_direct_destinations(origin="YVR"):
         raise _friendly_error(e, "destination lookup")
 
 
+# Inspiration results carry fares, which go stale within minutes. The
+# direct-destinations fallback only appears after an Inspiration error,
+# which is usually transient, so it gets the same short TTL rather than
+# hiding prices for longer; its route list is cached on its own anyway.
+@ttl_cache(ttl=5 * 60)
 def discover_destinations(origin="YVR", departure_date=None, max_price=None):
     """
     Find destinations from origin. Tries Inspiration Search first,
@@ -246,6 +317,21 @@ def discover_destinations(origin="YVR", departure_date=None, max_price=None):
     return [{"destination": code} for code in codes]
 
 
+def _annotate_offer(offer):
+    """
+    Parse an offer's price and destination once, so sorts and min() scans
+    downstream are lookups. Returns False if the offer is malformed.
+    """
+    try:
+        offer["_price_f"] = float(offer["price"]["grandTotal"])
+        offer["_dest"] = offer["itineraries"][0]["segments"][-1]["arrival"]["iataCode"]
+    except (KeyError, IndexError, TypeError, ValueError):
+        # One bad offer shouldn't sink the whole search (or its batch)
+        log.warning("skipping malformed offer %s", offer.get("id", "?"))
+        return False
+    return True
+
+
 def search_flights(
     origin="YVR",
     destination="NRT",
@@ -258,7 +344,11 @@ def search_flights(
     nonstop=False,
     max_price=None,
 ):
-    """Search for flights on a specific route with cabin class."""
+    """
+    Search for flights on a specific route with cabin class. Each offer
+    gets "_price_f" (grandTotal as a float) and "_dest" (final arrival IATA);
+    offers missing either are dropped.
+    """
     _check_cap()
     params = {
         "originLocationCode": origin,
@@ -279,12 +369,45 @@ def search_flights(
     try:
         response = amadeus.shopping.flight_offers_search.get(**params)
         _log_response(f"flight_offers {origin}->{destination}", response)
-        return response.data
+        flights = response.data
+        if flights:
+            flights = [f for f in flights if _annotate_offer(f)]
+        return flights
     except ResponseError as e:
         _log_error(f"flight_offers {origin}->{destination}", e)
         raise _friendly_error(e, "flight search")
 
 
+# Fares move, so only 5 minutes, like Inspiration prices: enough for
+# repeating a query without spending quota twice. The app caches its own
+# searches (run_search) and keeps calling search_flights directly.
+cached_search_flights = ttl_cache(ttl=5 * 60, max_size=1000)(search_flights)
+
+
+_ISO_DURATION_RE = re.compile(r"P(?:(\d+)D)?(?:T(?:(\d+)H)?(?:(\d+)M)?)?")
+
+
+def iso_minutes(duration):
+    """Convert an ISO 8601 duration like "PT9H30M" to minutes (0 if unparsable)."""
+    m = _ISO_DURATION_RE.match(duration or "")
+    if not m:
+        return 0
+    days, hours, minutes = (int(g) if g else 0 for g in m.groups())
+    return (days * 24 + hours) * 60 + minutes
+
+
+def _offer_price(flight):
+    return flight["_price_f"]
+
+
+def _by_price(flights, limit=None):
+    """Flights cheapest first; only the limit cheapest when limit is set."""
+    if limit is not None and limit < len(flights):
+        # O(N log k) and keeps only k offers instead of sorting all N
+        return heapq.nsmallest(limit, flights, key=_offer_price)
+    return sorted(flights, key=_offer_price)
+
+
 def search_anywhere(
     origin="YVR",
     departure_date=None,
@@ -295,8 +418,14 @@ def search_anywhere(
     currency="CAD",
     nonstop=False,
     on_progress=None,
+    limit=None,
+    max_workers=8,
 ):
-    """Legacy sequential search. Kept for test scripts."""
+    """
+    Legacy search from the Inspiration destinations. Kept for test scripts.
+    Every (cabin, destination) search is issued at once on the shared pool;
+    limit caps how many of the cheapest offers are kept per cabin.
+    """
     if cabins is None:
         cabins = ["ECONOMY", "BUSINESS"]
 
@@ -308,40 +437,40 @@ def search_anywhere(
         from datetime import date, timedelta
         departure_date = (date.today() + timedelta(days=30)).strftime("%Y-%m-%d")
 
-    top_dests = destinations[:top_n]
-    all_results = {}
+    executor = _get_executor(max_workers)
+    futures = {}
     for cabin in cabins:
-        cabin_results = []
-        for dest_info in top_dests:
+        for dest_info in destinations[:top_n]:
             dest_code = dest_info["destination"]
-            dep_date = departure_date or dest_info.get("departureDate")
-            ret_date = return_date or dest_info.get("returnDate")
-
-            if on_progress:
-                on_progress(cabin, dest_code)
-
-            try:
-                flights = search_flights(
-                    origin=origin,
-                    destination=dest_code,
-                    departure_date=dep_date,
-                    return_date=ret_date,
-                    cabin=cabin,
-                    adults=adults,
-                    currency=currency,
-                    nonstop=nonstop,
-                )
-                if flights:
-                    cabin_results.extend(flights)
-            except FlightSearchError:
-                continue
-
-        cabin_results.sort(key=lambda f: float(f["price"]["grandTotal"]))
-        all_results[cabin] = cabin_results
+            future = executor.submit(
+                search_flights,
+                origin=origin,
+                destination=dest_code,
+                departure_date=departure_date or dest_info.get("departureDate"),
+                return_date=return_date or dest_info.get("returnDate"),
+                cabin=cabin,
+                adults=adults,
+                currency=currency,
+                nonstop=nonstop,
+            )
+            futures[future] = (cabin, dest_code)
+
+    all_results = {cabin: [] for cabin in cabins}
+    for future in as_completed(futures):
+        cabin, dest_code = futures[future]
+        if on_progress:
+            on_progress(cabin, dest_code)
+        try:
+            flights = future.result()
+        except FlightSearchError:
+            continue
+        if flights:
+            all_results[cabin].extend(flights)
 
-    return all_results
+    return {cabin: _by_price(flights, limit) for cabin, flights in all_results.items()}
 
 
+@ttl_cache(ttl=24 * 3600, max_size=1024)
 def get_price_analysis(origin, destination, departure_date):
     """Get price metrics for a route using Amadeus Price Analysis API."""
     _check_cap()
@@ -352,6 +481,8 @@ def get_price_analysis(origin, destination, departure_date):
             departureDate=departure_date,
         )
         _log_response(f"price_metrics {origin}->{destination}", response)
+        # Parse the quartiles before the payload is cached and shared
+        _deal_thresholds(response.data)
         return response.data
     except ResponseError as e:
         _log_error(f"price_metrics {origin}->{destination}", e)
@@ -363,14 +494,18 @@ def get_price_analysis(origin, destination, departure_date):
 def compute_upgrade_value(all_results):
     """Compare economy vs business prices for overlapping destinations."""
     def cheapest_by_dest(flights):
-        by_dest = {}
-        for f in flights:
-            segments = f["itineraries"][0]["segments"]
-            dest = segments[-1]["arrival"]["iataCode"]
-            price = float(f["price"]["grandTotal"])
-            if dest not in by_dest or price < by_dest[dest]:
-                by_dest[dest] = price
-        return by_dest
+        if not flights:
+            return {}
+        # Grouped min over parallel arrays instead of a dict update per offer
+        dests, inverse = np.unique(
+            [f["_dest"] for f in flights], return_inverse=True
+        )
+        prices = np.fromiter(
+            (f["_price_f"] for f in flights), dtype=np.float64, count=len(flights)
+        )
+        mins = np.full(len(dests), np.inf)
+        np.minimum.at(mins, inverse, prices)
+        return dict(zip(dests.tolist(), mins.tolist()))
 
     econ = cheapest_by_dest(all_results.get("ECONOMY", []))
     biz = cheapest_by_dest(all_results.get("BUSINESS", []))
@@ -401,24 +536,22 @@ def compute_upgrade_value(all_results):
 
 def dedup_destinations(codes):
     """Remove secondary airports that serve the same city as a primary."""
-    seen_primary = set()
-    result = []
-    for code in codes:
-        primary = SAME_CITY_SKIP.get(code, code)
-        if primary not in seen_primary:
-            seen_primary.add(primary)
-            result.append(primary)
-    return result
+    # Map each code to its primary; dict.fromkeys keeps the first of each
+    return list(dict.fromkeys(map(SAME_CITY_SKIP.get, codes, codes)))
 
 
 def get_hub_destinations(regions=None):
     """Get curated hub destinations, optionally filtered by region."""
     if regions:
-        codes = []
-        for region in regions:
-            codes.extend(HUBS_BY_REGION.get(region, []))
-        return codes
-    return [code for codes in HUBS_BY_REGION.values() for code in codes]
+        return list(chain.from_iterable(
+            HUBS_BY_REGION.get(region, ()) for region in regions
+        ))
+    return list(chain.from_iterable(HUBS_BY_REGION.values()))
+
+
+def detect_currency(iata_code):
+    """Return the local currency for an airport code, defaulting to USD."""
+    return AIRPORT_CURRENCY.get(iata_code, "USD")
 
 
 # ---------------------------------------------------------------------------
@@ -427,6 +560,25 @@ def get_hub_destinations(regions=None):
 # Just like business class upgrades — the value is in doing things simultaneously
 # ---------------------------------------------------------------------------
 
+# One long-lived pool per size, shared by every search in the process, so
+# worker threads survive between calls instead of being started and torn
+# down for each one. Concurrent Streamlit sessions share the same workers,
+# which also caps how many Amadeus requests the app has in flight.
+_executors = {}
+_executors_lock = threading.Lock()
+
+
+def _get_executor(max_workers):
+    with _executors_lock:
+        executor = _executors.get(max_workers)
+        if executor is None:
+            executor = ThreadPoolExecutor(
+                max_workers=max_workers, thread_name_prefix="amadeus",
+            )
+            _executors[max_workers] = executor
+        return executor
+
+
 def search_parallel(
     origin,
     destinations,
@@ -440,8 +592,17 @@ def search_parallel(
     max_results=5,
     max_workers=8,
     on_progress=None,
+    limit=None,
 ):
-    """Search multiple destinations and cabins in parallel."""
+    """
+    Search multiple destinations and cabins in parallel.
+    Returns {cabin: [flight, ...]} with each list sorted by price, cheapest
+    first, and cut to the limit cheapest offers when limit is set.
+    """
+    # One GET per (cabin, dest) on purpose. The POST form of flight-offers
+    # takes several originDestinations, but they are legs of one itinerary
+    # (every offer covers all of them), not independent searches, so it
+    # cannot batch different destinations into one request.
     jobs = [(cabin, dest) for cabin in cabins for dest in destinations]
     results_by_cabin = {cabin: [] for cabin in cabins}
 
@@ -459,30 +620,28 @@ def search_parallel(
             max_price=max_price,
         )
 
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        futures = {
-            executor.submit(do_search, cabin, dest): (cabin, dest)
-            for cabin, dest in jobs
-        }
-        for future in as_completed(futures):
-            cabin, dest = futures[future]
-            if on_progress:
-                on_progress(cabin, dest)
-            try:
-                cabin, dest, flights = future.result()
-                if flights:
-                    results_by_cabin[cabin].extend(flights)
-            except (ApiCapExceeded, QuotaExhausted):
-                for f in futures:
-                    f.cancel()
-                raise
-            except FlightSearchError:
-                continue
+    executor = _get_executor(max_workers)
+    futures = {
+        executor.submit(do_search, cabin, dest): (cabin, dest)
+        for cabin, dest in jobs
+    }
+    for future in as_completed(futures):
+        cabin, dest = futures[future]
+        if on_progress:
+            on_progress(cabin, dest)
+        try:
+            cabin, dest, flights = future.result()
+            if flights:
+                results_by_cabin[cabin].extend(flights)
+        except (ApiCapExceeded, QuotaExhausted):
+            for f in futures:
+                f.cancel()
+            raise
+        except FlightSearchError:
+            continue
 
     for cabin in cabins:
-        results_by_cabin[cabin].sort(
-            key=lambda f: float(f["price"]["grandTotal"])
-        )
+        results_by_cabin[cabin] = _by_price(results_by_cabin[cabin], limit)
 
     return results_by_cabin
 
@@ -536,54 +695,56 @@ def search_flexible(
             max_price=max_price,
         )
 
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        futures = {
-            executor.submit(do_search, cab, dst, dep, ret): (cab, dst, dep)
-            for cab, dst, dep, ret in jobs
-        }
-        for future in as_completed(futures):
-            cab, dst, dep = futures[future]
-            try:
-                cabin, dest, dep_date, flights = future.result()
-                if not flights:
-                    continue
-                # Cheapest flight in this result set
-                cheapest_flight = min(
-                    flights, key=lambda f: float(f["price"]["grandTotal"])
-                )
-                price = float(cheapest_flight["price"]["grandTotal"])
-                key = (cabin, dest)
-                if key not in best:
-                    best[key] = {
-                        "price": price,
-                        "date": dep_date,
-                        "flight": cheapest_flight,
-                        "prices": [price],
-                    }
-                else:
-                    best[key]["prices"].append(price)
-                    if price < best[key]["price"]:
-                        best[key]["price"] = price
-                        best[key]["date"] = dep_date
-                        best[key]["flight"] = cheapest_flight
-            except (ApiCapExceeded, QuotaExhausted):
-                for f in futures:
-                    f.cancel()
-                raise
-            except FlightSearchError:
+    executor = _get_executor(max_workers)
+    futures = {
+        executor.submit(do_search, cab, dst, dep, ret): (cab, dst, dep)
+        for cab, dst, dep, ret in jobs
+    }
+    for future in as_completed(futures):
+        cab, dst, dep = futures[future]
+        try:
+            cabin, dest, dep_date, flights = future.result()
+            if not flights:
                 continue
+            # Cheapest flight in this result set
+            cheapest_flight = min(flights, key=_offer_price)
+            price = cheapest_flight["_price_f"]
+            key = (cabin, dest)
+            info = best.get(key)
+            if info is None:
+                best[key] = {
+                    "price": price,
+                    "date": dep_date,
+                    "flight": cheapest_flight,
+                    "max": price,
+                    "n": 1,
+                }
+            else:
+                # Running min/max/count: no per-date price list to keep
+                info["n"] += 1
+                if price > info["max"]:
+                    info["max"] = price
+                if price < info["price"]:
+                    info["price"] = price
+                    info["date"] = dep_date
+                    info["flight"] = cheapest_flight
+        except (ApiCapExceeded, QuotaExhausted):
+            for f in futures:
+                f.cancel()
+            raise
+        except FlightSearchError:
+            continue
 
     # Build final structure: {cabin: {dest: {...}}}
     result = {cabin: {} for cabin in cabins}
     for (cabin, dest), info in best.items():
-        max_price_found = max(info["prices"])
         result[cabin][dest] = {
             "flight": info["flight"],
             "price": info["price"],
             "date": info["date"],
-            "max_price_found": max_price_found,
-            "savings": max_price_found - info["price"],
-            "dates_checked": len(info["prices"]),
+            "max_price_found": info["max"],
+            "savings": info["max"] - info["price"],
+            "dates_checked": info["n"],
         }
 
     return result
@@ -593,7 +754,41 @@ def search_flexible(
 # Airline name lookup
 # ---------------------------------------------------------------------------
 
-_airline_cache = {}
+# Per code, for the life of the process, so it already survives Streamlit
+# reruns and partially overlapping searches: only unseen codes cost an API
+# call. No need to wrap lookup_airlines_batch in st.cache_data on top.
+# Resolved names are also saved to AIRLINE_CACHE_FILE so restarts start
+# warm; code→code misses stay in memory only, so a failed lookup is never
+# persisted.
+AIRLINE_CACHE_FILE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "airline_cache.json"
+)
+_airline_file_lock = threading.Lock()
+
+
+def _load_airline_cache():
+    try:
+        with open(AIRLINE_CACHE_FILE, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def _save_airline_cache():
+    """Atomically write every resolved airline name to AIRLINE_CACHE_FILE."""
+    names = {c: n for c, n in list(_airline_cache.items()) if n != c}
+    with _airline_file_lock:
+        tmp_path = AIRLINE_CACHE_FILE + ".tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(names, f, sort_keys=True)
+            os.replace(tmp_path, AIRLINE_CACHE_FILE)
+        except OSError as e:
+            log.warning("could not save airline cache: %s", e)
+
+
+_airline_cache = _load_airline_cache()
 
 # Corporate suffixes: because "ACME AIRLINES LTD. D/B/A FLYING CORP." is not a name, it's a legal filing
 _STRIP_SUFFIXES = [
@@ -602,6 +797,13 @@ _STRIP_SUFFIXES = [
     " LLC", " PLC", " GROUP", " HOLDINGS", " ENTERPRISES",
     " PTY", " NV", " BV", " SE",
 ]
+# Any run of those suffixes at the very end of the name, each separated
+# only by whitespace. Longest first so " LTD." wins over " LTD".
+_SUFFIX_RE = re.compile(
+    r"(?:\s*(?:%s))+\Z" % "|".join(
+        map(re.escape, sorted(_STRIP_SUFFIXES, key=len, reverse=True))
+    )
+)
 
 
 def clean_airline_name(raw_name):
@@ -609,13 +811,9 @@ def clean_airline_name(raw_name):
     if not raw_name or len(raw_name) <= 2:
         return raw_name
     name = raw_name.upper()
-    changed = True
-    while changed:
-        changed = False
-        for suffix in _STRIP_SUFFIXES:
-            if name.endswith(suffix):
-                name = name[: -len(suffix)].rstrip()
-                changed = True
+    m = _SUFFIX_RE.search(name)
+    if m:
+        name = name[: m.start()].rstrip()
     # Title case, but preserve known all-caps like "KLM" or "SAS"
     if len(name) <= 3:
         return name
@@ -626,6 +824,7 @@ def lookup_airlines_batch(codes):
     """Look up airline names by IATA codes. Single API call for all unknowns."""
     to_fetch = [c for c in codes if c not in _airline_cache]
     if to_fetch:
+        fetched = False
         try:
             _check_cap()
             codes_str = ",".join(to_fetch)
@@ -637,6 +836,7 @@ def lookup_airlines_batch(codes):
                         or airline.get("commonName")
                         or iata)
                 _airline_cache[iata] = clean_airline_name(name)
+                fetched = True
         except ResponseError as e:
             _log_error("airlines", e)
         except FlightSearchError:
@@ -645,48 +845,102 @@ def lookup_airlines_batch(codes):
         for code in to_fetch:
             if code not in _airline_cache:
                 _airline_cache[code] = code
+        if fetched:
+            _save_airline_cache()
 
     return {code: _airline_cache.get(code, code) for code in codes}
 
 
+def join_airline_names(flights, airline_names):
+    """
+    Map {key: flight} to {key: "Airline A, Airline B"} for its outbound
+    segments. Each distinct set of carriers is sorted and joined once.
+    """
+    joined = {}
+    result = {}
+    for key, flight in flights.items():
+        codes = frozenset(
+            s["carrierCode"] for s in flight["itineraries"][0]["segments"]
+        )
+        if codes not in joined:
+            joined[codes] = ", ".join(sorted(set(
+                airline_names.get(c, c) for c in codes
+            )))
+        result[key] = joined[codes]
+    return result
+
+
 # ---------------------------------------------------------------------------
 # Deal score
 # ---------------------------------------------------------------------------
 
-def compute_deal_label(price, price_data):
-    """Compare price against quartile thresholds from price analysis."""
+_DEAL_LABELS = ["Great Deal", "Good Price", "Average", "Above Average"]
+
+
+def _deal_thresholds(price_data):
+    """
+    Return (first, medium, third) quartile amounts, NaN where missing.
+    The tuple is stored on the metrics dict as "_thresholds", so a cached
+    price_data payload is only parsed once.
+    """
     if not price_data:
-        return "N/A"
+        return np.nan, np.nan, np.nan
 
     # price_data is a list; first item has priceMetrics
-    metrics_list = None
+    item = None
     if isinstance(price_data, list) and len(price_data) > 0:
-        metrics_list = price_data[0].get("priceMetrics", [])
+        item = price_data[0]
     elif isinstance(price_data, dict):
-        metrics_list = price_data.get("priceMetrics", [])
-
-    if not metrics_list:
-        return "N/A"
+        item = price_data
+    if item is None:
+        return np.nan, np.nan, np.nan
+    cached = item.get("_thresholds")
+    if cached is not None:
+        return cached
 
     thresholds = {}
-    for m in metrics_list:
+    for m in item.get("priceMetrics", []) or []:
         ranking = m.get("quartileRanking", "")
         try:
             thresholds[ranking] = float(m.get("amount", 0))
         except (ValueError, TypeError):
             continue
 
-    first = thresholds.get("FIRST")
-    medium = thresholds.get("MEDIUM")
-    third = thresholds.get("THIRD")
+    item["_thresholds"] = result = (
+        thresholds.get("FIRST", np.nan),
+        thresholds.get("MEDIUM", np.nan),
+        thresholds.get("THIRD", np.nan),
+    )
+    return result
 
-    if first is not None and price <= first:
+
+def compute_deal_labels(prices, price_data_list):
+    """Label each price against its own quartile thresholds in one pass."""
+    if len(prices) == 0:
+        return []
+    prices = np.asarray(prices, dtype=float)
+    first, medium, third = np.array(
+        [_deal_thresholds(d) for d in price_data_list], dtype=float
+    ).reshape(-1, 3).T
+    # NaN thresholds compare False, so missing quartiles fall through
+    return np.select(
+        [prices <= first, prices <= medium, prices <= third,
+         ~np.isnan(third)],
+        _DEAL_LABELS,
+        default="N/A",
+    ).tolist()
+
+
+def compute_deal_label(price, price_data):
+    """Compare price against quartile thresholds from price analysis."""
+    first, medium, third = _deal_thresholds(price_data)
+    if price <= first:
         return "Great Deal"
-    if medium is not None and price <= medium:
+    if price <= medium:
         return "Good Price"
-    if third is not None and price <= third:
+    if price <= third:
         return "Average"
-    if third is not None:
+    if not np.isnan(third):
         return "Above Average"
     return "N/A"
 
@@ -698,15 +952,15 @@ def get_deal_scores_parallel(origin, destinations, departure_date):
     def fetch(dest):
         return dest, get_price_analysis(origin, dest, departure_date)
 
-    with ThreadPoolExecutor(max_workers=8) as executor:
-        futures = {executor.submit(fetch, d): d for d in destinations}
-        for future in as_completed(futures):
-            dest = futures[future]
-            try:
-                dest, data = future.result()
-                scores[dest] = data
-            except Exception:
-                scores[dest] = None
+    executor = _get_executor(8)
+    futures = {executor.submit(fetch, d): d for d in destinations}
+    for future in as_completed(futures):
+        dest = futures[future]
+        try:
+            dest, data = future.result()
+            scores[dest] = data
+        except Exception:
+            scores[dest] = None
 
     return scores
 
@@ -715,6 +969,22 @@ def get_deal_scores_parallel(origin, destinations, departure_date):
 # Flight delay prediction
 # ---------------------------------------------------------------------------
 
+# (carrier, origin, destination) routes the delay model has returned no
+# prediction for. They are skipped without spending an API call until
+# DELAY_SKIP_TTL passes, so one empty answer doesn't rule a route out for
+# good. Memory only: the routes come from users' searches (see PRIVACY.md).
+DELAY_SKIP_TTL = 24 * 3600
+_delay_skip = TTLCache(max_size=1000, default_ttl=DELAY_SKIP_TTL)
+
+
+def _delay_route(segment):
+    return " ".join((
+        segment["carrierCode"],
+        segment["departure"]["iataCode"],
+        segment["arrival"]["iataCode"],
+    ))
+
+
 def predict_delay(segment):
     """
     Predict on-time probability for a flight segment.
@@ -723,6 +993,9 @@ def predict_delay(segment):
     try:
         dep_dt = segment["departure"]["at"]
         arr_dt = segment["arrival"]["at"]
+        route = _delay_route(segment)
+        if _delay_skip.get(route, record=False):
+            return None
 
         _check_cap()
         flight_id = f"{segment['carrierCode']}{segment['number']}"
@@ -741,6 +1014,7 @@ def predict_delay(segment):
         _log_response(f"delay_prediction {flight_id}", response)
 
         if not response.data:
+            _delay_skip.set(route, True)
             return None
 
         # Response is a list of prediction objects with id and probability
@@ -765,14 +1039,79 @@ def predict_delay(segment):
         return None
 
 
+def _segment_key(segment):
+    """Identify a scheduled flight: route, carrier, flight number, departure."""
+    return (
+        segment["departure"]["iataCode"],
+        segment["arrival"]["iataCode"],
+        segment["carrierCode"],
+        segment["number"],
+        segment["departure"]["at"],
+    )
+
+
+def predict_delays_parallel(segments, max_workers=8):
+    """
+    Predict on-time probability for {key: segment} in parallel.
+    Returns {key: prediction}; predict_delay already maps failures to None.
+    The prediction API takes one flight per request, so the same flight
+    showing up under several keys (e.g. economy and business) is only
+    requested once.
+    """
+    unique = {}
+    for seg in segments.values():
+        unique.setdefault(_segment_key(seg), seg)
+
+    by_flight = {}
+
+    def fetch(flight_key, seg):
+        return flight_key, predict_delay(seg)
+
+    executor = _get_executor(max_workers)
+    futures = [
+        executor.submit(fetch, flight_key, seg)
+        for flight_key, seg in unique.items()
+    ]
+    for future in as_completed(futures):
+        flight_key, prediction = future.result()
+        by_flight[flight_key] = prediction
+
+    return {
+        key: by_flight[_segment_key(seg)] for key, seg in segments.items()
+    }
+
+
 # ---------------------------------------------------------------------------
 # Google Flights URL
 # ---------------------------------------------------------------------------
 
+_CABIN_STR = {"ECONOMY": "economy", "BUSINESS": "business", "FIRST": "first"}
+# The query with its fixed words already percent-encoded; only the fields
+# are quoted per call.
+_GOOGLE_FLIGHTS_URL = (
+    "https://www.google.com/travel/flights?q="
+    + quote("Flights to {dest} from {origin} on {date} {cabin} class", safe="{}")
+).format
+
+
 def google_flights_url(origin, dest, dep_date, cabin="ECONOMY"):
     """Build a Google Flights search URL."""
-    from urllib.parse import quote
-    cabin_map = {"ECONOMY": "economy", "BUSINESS": "business", "FIRST": "first"}
-    cabin_str = cabin_map.get(cabin, "economy")
-    query = f"Flights to {dest} from {origin} on {dep_date} {cabin_str} class"
-    return f"https://www.google.com/travel/flights?q={quote(query)}"
+    return _GOOGLE_FLIGHTS_URL(
+        dest=quote(dest),
+        origin=quote(origin),
+        date=quote(dep_date),
+        cabin=_CABIN_STR.get(cabin, "economy"),
+    )
+
+
+def google_flights_urls(origin, dests, dep_date, cabin="ECONOMY"):
+    """
+    Build Google Flights search URLs for several destinations that share an
+    origin, date and cabin. Only the destination is quoted per URL.
+    """
+    shared = {
+        "origin": quote(origin),
+        "date": quote(dep_date),
+        "cabin": _CABIN_STR.get(cabin, "economy"),
+    }
+    return [_GOOGLE_FLIGHTS_URL(dest=quote(dest), **shared) for dest in dests]
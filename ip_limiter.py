@@ -1,28 +1,109 @@
-import json
+import logging
 import os
+import sqlite3
 import threading
-from datetime import datetime, timezone
+import time
 
-IP_LIMITS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ip_limits.json")
+from api_usage import get_usage
+
+IP_LIMITS_DB = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ip_limits.db")
 IP_DAILY_CAP = 10
-_lock = threading.Lock()
+# Seconds to wait before retrying when another process held the database
+# past the connection's 5s busy timeout
+BUSY_RETRY_AFTER = 5
+log = logging.getLogger("makemefly.ip_limiter")
+# One row per IP, holding its count for the day it last searched. WAL lets
+# readers proceed during a write and SQLite's own file locking keeps the
+# counts exact across several Streamlit processes. Each check is a single
+# UPSERT rather than a read-modify-write of the whole store.
+_SCHEMA = "CREATE TABLE IF NOT EXISTS ip_counts(ip TEXT PRIMARY KEY, day TEXT, n INTEGER)"
+# Charges excluded.n searches unless that would take today's count past the
+# cap; a row left over from an earlier day restarts from zero. Changes no
+# row when the charge is refused. No RETURNING (SQLite 3.35+; Debian
+# bullseye ships 3.34), so _charge reads n back in the same transaction.
+_CHARGE = """
+INSERT INTO ip_counts(ip, day, n) VALUES (?, ?, ?)
+ON CONFLICT(ip) DO UPDATE SET
+    n = CASE WHEN day = excluded.day THEN n + excluded.n ELSE excluded.n END,
+    day = excluded.day
+WHERE day != excluded.day OR n + excluded.n <= ?
+"""
+# One connection for the process, shared by every Streamlit script thread
+# (each rerun runs on a fresh one) so the PRAGMAs and schema check run
+# once. sqlite3 connections aren't safe to use from two threads at once,
+# hence _db_lock around every use.
+_conn = None
+_db_lock = threading.Lock()
+_today_cache = (None, "")   # (epoch day, formatted date)
+_pruned_day = None          # last day rows from earlier days were deleted
 
 
 def _today():
-    return datetime.now(timezone.utc).strftime("%Y-%m-%d")
+    """Today's UTC date as YYYY-MM-DD, reformatted only when the day changes."""
+    global _today_cache
+    day = int(time.time()) // 86400
+    if day != _today_cache[0]:
+        _today_cache = (day, time.strftime("%Y-%m-%d", time.gmtime(day * 86400)))
+    return _today_cache[1]
 
 
-def _read_limits():
-    try:
-        with open(IP_LIMITS_FILE, "r") as f:
-            return json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError):
-        return {"date": _today(), "ips": {}}
+def _seconds_until_reset():
+    """Seconds until counts reset at midnight UTC."""
+    return 86400 - int(time.time()) % 86400
+
+
+def _db():
+    """The shared connection, opened (and the table created) on first use.
+    Caller holds _db_lock."""
+    global _conn, _pruned_day
+    conn = _conn
+    if conn is None:
+        conn = sqlite3.connect(
+            IP_LIMITS_DB, isolation_level=None, timeout=5,
+            check_same_thread=False,
+        )
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(_SCHEMA)
+        _conn = conn
+    today = _today()
+    if _pruned_day != today:
+        # Yesterday's counts are dead weight once the day rolls over
+        _pruned_day = today
+        conn.execute("DELETE FROM ip_counts WHERE day != ?", (today,))
+    return conn
+
+
+def _count(conn, ip_address, today):
+    row = conn.execute(
+        "SELECT n FROM ip_counts WHERE ip = ? AND day = ?", (ip_address, today)
+    ).fetchone()
+    return row[0] if row else 0
+
 
+def _charge(ip_address, cost):
+    """Charge cost searches to an IP. Returns (charged, count_after)."""
+    with _db_lock:
+        conn = _db()
+        today = _today()
+        # IMMEDIATE takes the write lock up front, so no other process can
+        # charge this IP between the UPSERT and reading n back
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            charged = conn.execute(
+                _CHARGE, (ip_address, today, cost, IP_DAILY_CAP)
+            ).rowcount > 0
+            count = _count(conn, ip_address, today)
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        return charged, count
 
-def _write_limits(data):
-    with open(IP_LIMITS_FILE, "w") as f:
-        json.dump(data, f)
+
+def _usage(ip_address):
+    with _db_lock:
+        return _count(_db(), ip_address, _today())
 
 
 def check_ip_limit(ip_address):
@@ -31,22 +112,38 @@ def check_ip_limit(ip_address):
     Returns True if under the daily cap, False if limit exceeded.
     Resets all counts at midnight UTC.
     """
-    with _lock:
-        data = _read_limits()
-        if data.get("date") != _today():
-            data = {"date": _today(), "ips": {}}
-        count = data["ips"].get(ip_address, 0)
-        if count >= IP_DAILY_CAP:
-            return False
-        data["ips"][ip_address] = count + 1
-        _write_limits(data)
-        return True
+    return _charge(ip_address, 1)[0]
 
 
 def get_ip_usage(ip_address):
     """Return (searches_used, daily_cap) for an IP address."""
-    with _lock:
-        data = _read_limits()
-        if data.get("date") != _today():
-            return 0, IP_DAILY_CAP
-        return data["ips"].get(ip_address, 0), IP_DAILY_CAP
+    return _usage(ip_address), IP_DAILY_CAP
+
+
+def charge_and_check(ip_address, cost=1):
+    """
+    Check the app-wide API cap and charge cost searches to an IP in one step.
+    Returns (allowed, remaining, retry_after) where remaining is the IP's
+    searches left today and retry_after is seconds until the midnight UTC
+    reset (0 when allowed). Nothing is charged when the API cap is already
+    reached, so allowed=False with remaining > 0 means the app cap, not the
+    IP's, is the one that was hit. When the count database stays locked,
+    nothing is charged and (False, None, BUSY_RETRY_AFTER) is returned.
+    Raises ValueError if cost is more than IP_DAILY_CAP, which no IP could
+    ever be allowed.
+    """
+    if cost > IP_DAILY_CAP:
+        raise ValueError(f"cost {cost} exceeds IP_DAILY_CAP ({IP_DAILY_CAP})")
+    calls_today, daily_cap = get_usage()
+    try:
+        if calls_today >= daily_cap:
+            count = _usage(ip_address)
+            return False, max(IP_DAILY_CAP - count, 0), _seconds_until_reset()
+        allowed, count = _charge(ip_address, cost)
+    except sqlite3.OperationalError as e:
+        # "database is locked": other processes held it past the timeout
+        log.warning("ip limit check failed: %s", e)
+        return False, None, BUSY_RETRY_AFTER
+    if not allowed:
+        return False, max(IP_DAILY_CAP - count, 0), _seconds_until_reset()
+    return True, IP_DAILY_CAP - count, 0
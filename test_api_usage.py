@@ -0,0 +1,72 @@
+"""
+Counts stay exact while increment_usage races flushes in multi-process
+mode. Offline: uses a throwaway usage file, no API calls.
+
+Run with pytest, or as a script.
+"""
+import os
+import sys
+import tempfile
+import threading
+
+import api_usage
+
+THREADS = 8
+CALLS = 5000
+
+
+def test_increments_survive_concurrent_flushes():
+    with tempfile.TemporaryDirectory() as tmp:
+        saved = (api_usage.USAGE_FILE, api_usage.MULTI_PROCESS, api_usage.DAILY_CAP)
+        api_usage.USAGE_FILE = os.path.join(tmp, "api_usage.json")
+        api_usage.MULTI_PROCESS = api_usage.fcntl is not None
+        api_usage.DAILY_CAP = THREADS * CALLS * 2
+        switch = sys.getswitchinterval()
+        sys.setswitchinterval(1e-5)     # switch threads often to provoke races
+        try:
+            with api_usage._lock:
+                api_usage._close_fd()
+                api_usage._state.day = None
+                api_usage._sync_locked(api_usage._today_day())
+
+            done = threading.Event()
+
+            def flusher():
+                while not done.is_set():
+                    with api_usage._lock:
+                        api_usage._flush_locked()
+
+            def caller(allowed):
+                allowed.append(sum(api_usage.increment_usage() for _ in range(CALLS)))
+
+            allowed = []
+            callers = [threading.Thread(target=caller, args=(allowed,))
+                       for _ in range(THREADS)]
+            flushing = threading.Thread(target=flusher)
+            flushing.start()
+            for t in callers:
+                t.start()
+            for t in callers:
+                t.join()
+            done.set()
+            flushing.join()
+            api_usage.flush()
+
+            assert sum(allowed) == THREADS * CALLS
+            day, calls = api_usage._read_usage()
+            assert calls == THREADS * CALLS
+        finally:
+            sys.setswitchinterval(switch)
+            api_usage.flush()
+            api_usage._close_fd()
+            if api_usage._lock_fd is not None:
+                os.close(api_usage._lock_fd)
+                api_usage._lock_fd = None
+            api_usage.USAGE_FILE, api_usage.MULTI_PROCESS, api_usage.DAILY_CAP = saved
+            with api_usage._lock:
+                api_usage._state.day = None
+
+
+if __name__ == "__main__":
+    test_increments_survive_concurrent_flushes()
+    print("ok")
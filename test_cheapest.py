@@ -3,7 +3,7 @@ Scan a wider set of popular destinations from YVR to find the cheapest
 business class fares. Uses the direct destinations list but picks a diverse
 mix of short/medium/long haul routes.
 """
-import time
+import asyncio
 from flight_finder import get_direct_destinations, search_flights
 
 ORIGIN = "YVR"
@@ -26,38 +26,60 @@ scan_dests = [
 scan_dests = [d for d in scan_dests if d in all_dests]
 print(f"Scanning {len(scan_dests)} destinations: {', '.join(scan_dests)}\n")
 
-results = []
-for dest in scan_dests:
-    try:
-        flights = search_flights(
-            origin=ORIGIN,
-            destination=dest,
-            departure_date=DEPARTURE,
-            return_date=RETURN,
-            cabin="BUSINESS",
-            max_results=1,
-            currency="CAD",
-        )
-        if flights:
-            f = flights[0]
-            price = float(f["price"]["grandTotal"])
-            segments = f["itineraries"][0]["segments"]
-            stops = len(segments) - 1
-            carriers = ", ".join(sorted(set(s["carrierCode"] for s in segments)))
-            duration = f["itineraries"][0].get("duration", "").replace("PT", "")
-            results.append({
-                "dest": dest,
-                "price": price,
-                "carriers": carriers,
-                "stops": stops,
-                "duration": duration,
-            })
-            print(f"  {dest}: ${price:,.0f} CAD ({carriers}, {stops} stop{'s' if stops != 1 else ''}, {duration})")
-        else:
+
+def scan_one(dest):
+    """Search one destination; returns (dest, result dict or None)."""
+    flights = search_flights(
+        origin=ORIGIN,
+        destination=dest,
+        departure_date=DEPARTURE,
+        return_date=RETURN,
+        cabin="BUSINESS",
+        max_results=1,
+        currency="CAD",
+    )
+    if not flights:
+        return dest, None
+    f = flights[0]
+    segments = f["itineraries"][0]["segments"]
+    return dest, {
+        "dest": dest,
+        "price": f["_price_f"],
+        "carriers": ", ".join(sorted(set(s["carrierCode"] for s in segments))),
+        "stops": len(segments) - 1,
+        "duration": f["itineraries"][0].get("duration", "").replace("PT", ""),
+    }
+
+
+async def scan(dests, concurrency=8):
+    """
+    Run the searches in threads and print each one as it finishes.
+    The transport's rate limiter paces the requests, so no sleeps here.
+    """
+    sem = asyncio.Semaphore(concurrency)
+
+    async def bounded(dest):
+        async with sem:
+            try:
+                return await asyncio.to_thread(scan_one, dest)
+            except Exception as e:
+                return dest, e
+
+    found = []
+    for coro in asyncio.as_completed([bounded(d) for d in dests]):
+        dest, r = await coro
+        if isinstance(r, Exception):
+            print(f"  {dest}: error — {r}")
+        elif r is None:
             print(f"  {dest}: no results")
-    except Exception as e:
-        print(f"  {dest}: error — {e}")
-    time.sleep(0.15)
+        else:
+            found.append(r)
+            stops = r["stops"]
+            print(f"  {dest}: ${r['price']:,.0f} CAD ({r['carriers']}, {stops} stop{'s' if stops != 1 else ''}, {r['duration']})")
+    return found
+
+
+results = asyncio.run(scan(scan_dests))
 
 # Sort by price and show top 5
 print(f"\n\n=== Top 5 Cheapest Business Class from {ORIGIN} (round-trip, {DEPARTURE} to {RETURN}) ===\n")
@@ -0,0 +1,52 @@
+"""
+A malformed offer is dropped from search_flights' results instead of
+failing the whole search. Offline: the Amadeus call is replaced by a
+canned response, so no credentials or quota are needed.
+
+Run with pytest, or as a script.
+"""
+import os
+from unittest import mock
+
+os.environ.setdefault("AMADEUS_CLIENT_ID", "offline")
+os.environ.setdefault("AMADEUS_CLIENT_SECRET", "offline")
+
+import flight_finder
+
+
+def _offer(offer_id, total, dest):
+    return {
+        "id": offer_id,
+        "price": {"grandTotal": total},
+        "itineraries": [{"segments": [{"arrival": {"iataCode": dest}}]}],
+    }
+
+
+def test_malformed_offer_is_skipped():
+    no_price = _offer("2", "1.00", "LHR")
+    del no_price["price"]
+    no_segments = _offer("3", "1.00", "LHR")
+    no_segments["itineraries"][0]["segments"] = []
+    offers = [
+        _offer("1", "812.40", "NRT"),
+        no_price,
+        no_segments,
+        _offer("4", "n/a", "LHR"),
+        _offer("5", "640.00", "HND"),
+    ]
+    response = mock.Mock(data=offers)
+    with mock.patch.object(flight_finder, "_check_cap"), \
+            mock.patch.object(flight_finder, "_log_response"), \
+            mock.patch.object(flight_finder.amadeus.shopping.flight_offers_search,
+                              "get", return_value=response):
+        flights = flight_finder.search_flights(origin="YVR", destination="NRT")
+
+    assert [f["id"] for f in flights] == ["1", "5"]
+    assert [(f["_price_f"], f["_dest"]) for f in flights] == [
+        (812.40, "NRT"), (640.00, "HND"),
+    ]
+
+
+if __name__ == "__main__":
+    test_malformed_offer_is_skipped()
+    print("ok")
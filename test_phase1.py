@@ -1,51 +1,59 @@
 """
 Phase 1 test: Discover destinations from YVR, then get business class pricing
 for the top 5 cheapest.
+
+Run as a script, or import run_phase1() / print_summary() to drive the
+pipeline from elsewhere (e.g. a timing harness) without running it on import.
 """
-import time
-from flight_finder import discover_destinations, search_flights
+import asyncio
+import heapq
+import sys
+from operator import itemgetter
+
+from flight_finder import discover_destinations, cached_search_flights, iso_minutes
 
 ORIGIN = "YVR"
 TOP_N = 5
 DEPARTURE = "2026-03-15"
 RETURN = "2026-03-22"
-
-# Step 1: Discover destinations from YVR
-print(f"=== Step 1: Discovering destinations from {ORIGIN} ===\n")
-destinations = discover_destinations(origin=ORIGIN)
-
-if not destinations:
-    print("No destinations returned. Check API credentials.")
-    raise SystemExit(1)
-
-print(f"Found {len(destinations)} destinations.")
-
-# If inspiration search returned prices, show them sorted
-has_prices = "price" in destinations[0]
-if has_prices:
-    print(f"\nTop {TOP_N} cheapest (from Inspiration Search):\n")
-    print(f"{'Dest':<6} {'Price':>8}  {'Depart':<12} {'Return':<12}")
-    print("-" * 42)
-    for d in destinations[:TOP_N]:
-        print(f"{d['destination']:<6} ${float(d['price']['total']):>7,.0f}  "
-              f"{d.get('departureDate', 'N/A'):<12} {d.get('returnDate', 'N/A'):<12}")
-else:
-    print(f"Using direct destinations fallback (no pre-sorted prices).")
-    print(f"First {TOP_N}: {', '.join(d['destination'] for d in destinations[:TOP_N])}")
-
-# Step 2: Business class pricing for top 5
-print(f"\n\n=== Step 2: Business Class Pricing — {ORIGIN} → Top {TOP_N} ===\n")
-
-results = []
-for dest_info in destinations[:TOP_N]:
+CONCURRENCY = 8     # searches in flight at once, under the 10 req/sec limit
+DISPLAY_K = 15      # cheapest options listed in the summary (all 3 x TOP_N)
+# Table rows, with each format spec parsed once
+DEST_ROW = "{:<6} ${:>7,.0f}  {:<12} {:<12}".format
+SUMMARY_ROW = "{:<6} ${:>9,.0f}  {:<8} {:<6} {:<10} {}".format
+
+
+def show_destinations(destinations, top_n):
+    """Print the Step 1 summary of what discovery found."""
+    print(f"Found {len(destinations)} destinations.")
+
+    # If inspiration search returned prices, show them sorted
+    has_prices = "price" in destinations[0]
+    if has_prices:
+        print(f"\nTop {top_n} cheapest (from Inspiration Search):\n")
+        print(f"{'Dest':<6} {'Price':>8}  {'Depart':<12} {'Return':<12}")
+        print("-" * 42)
+        sys.stdout.write("".join(
+            DEST_ROW(d["destination"], float(d["price"]["total"]),
+                     d.get("departureDate", "N/A"), d.get("returnDate", "N/A"))
+            + "\n"
+            for d in destinations[:top_n]
+        ))
+    else:
+        print(f"Using direct destinations fallback (no pre-sorted prices).")
+        print(f"First {top_n}: {', '.join(d['destination'] for d in destinations[:top_n])}")
+
+
+def fetch_one(origin, dest_info, departure, return_date):
+    """Search one destination (blocking; run in a worker thread)."""
     dest = dest_info["destination"]
-    dep = dest_info.get("departureDate", DEPARTURE)
-    ret = dest_info.get("returnDate", RETURN)
-
-    print(f"Searching {ORIGIN} → {dest} ({dep} to {ret})...", end=" ", flush=True)
-
-    flights = search_flights(
-        origin=ORIGIN,
+    dep = dest_info.get("departureDate", departure)
+    ret = dest_info.get("returnDate", return_date)
+    # No sleep between calls: amadeus_transport.limiter keeps every
+    # request under the per-second limit, blocking only the worker
+    # thread (never the event loop) and only when the window is full.
+    flights = cached_search_flights(
+        origin=origin,
         destination=dest,
         departure_date=dep,
         return_date=ret,
@@ -53,49 +61,133 @@ for dest_info in destinations[:TOP_N]:
         max_results=3,
         currency="CAD",
     )
-
-    if not flights:
-        print("no results")
-        continue
-
-    cheapest = flights[0]
-    price = float(cheapest["price"]["grandTotal"])
-    print(f"${price:,.0f} CAD")
-
-    for i, f in enumerate(flights, 1):
-        p = float(f["price"]["grandTotal"])
+    return dest, dep, ret, flights
+
+
+async def discover_and_search(origin, top_n, departure, return_date):
+    """
+    Step 1 and Step 2 in one event loop: a producer runs discovery and
+    queues the top top_n destinations, and CONCURRENCY workers start
+    searching as soon as each one is queued. Returns (destinations,
+    outcomes) with one outcome (or exception) per queued destination,
+    in destination order.
+    """
+    queue = asyncio.Queue(maxsize=top_n)
+    destinations = []
+    outcomes = {}
+
+    async def producer():
+        print(f"=== Step 1: Discovering destinations from {origin} ===\n")
+        destinations.extend(
+            await asyncio.to_thread(discover_destinations, origin=origin) or []
+        )
+        if destinations:
+            for item in enumerate(destinations[:top_n]):
+                await queue.put(item)
+            show_destinations(destinations, top_n)
+        for _ in range(CONCURRENCY):
+            await queue.put(None)
+
+    async def worker():
+        while (item := await queue.get()) is not None:
+            i, dest_info = item
+            try:
+                outcomes[i] = await asyncio.to_thread(
+                    fetch_one, origin, dest_info, departure, return_date
+                )
+            except Exception as e:
+                outcomes[i] = e
+
+    await asyncio.gather(producer(), *(worker() for _ in range(CONCURRENCY)))
+    return destinations, [outcomes[i] for i in sorted(outcomes)]
+
+
+def summarize_offers(dest, flights):
+    """One result row per offer, walking each offer's segments once."""
+    rows = []
+    for f in flights:
         itinerary = f["itineraries"][0]
         segments = itinerary["segments"]
-        stops = len(segments) - 1
-        carriers = ", ".join(sorted(set(s["carrierCode"] for s in segments)))
-        duration = itinerary.get("duration", "").replace("PT", "")
-        route = " → ".join(
-            [segments[0]["departure"]["iataCode"]]
-            + [s["arrival"]["iataCode"] for s in segments]
-        )
-        dep_time = segments[0]["departure"]["at"]
-
-        results.append({
+        # One pass over the segments for carriers and the route
+        first_dep = segments[0]["departure"]
+        carriers_set = set()
+        route = [first_dep["iataCode"]]
+        for seg in segments:
+            carriers_set.add(seg["carrierCode"])
+            route.append(seg["arrival"]["iataCode"])
+
+        rows.append({
             "dest": dest,
-            "price": p,
-            "carriers": carriers,
-            "stops": stops,
-            "duration": duration,
-            "route": route,
-            "depart": dep_time,
+            "price": f["_price_f"],
+            "carriers": ", ".join(sorted(carriers_set)),
+            "stops": len(segments) - 1,
+            "duration": itinerary.get("duration", "").replace("PT", ""),
+            # Numeric twin of "duration" for sorting and filtering
+            "duration_min": iso_minutes(itinerary.get("duration")),
+            "route": " → ".join(route),
+            "depart": first_dep["at"],
         })
+    return rows
+
+
+async def run_phase1(origin=ORIGIN, top_n=TOP_N, departure=DEPARTURE,
+                     return_date=RETURN):
+    """
+    Discover destinations from origin and price business class to the
+    top_n of them, printing progress. Returns the result rows, or None
+    when discovery found nothing.
+    """
+    destinations, outcomes = await discover_and_search(
+        origin, top_n, departure, return_date
+    )
+    if not destinations:
+        return None
+
+    # Step 2: Business class pricing for top 5
+    print(f"\n\n=== Step 2: Business Class Pricing — {origin} → Top {top_n} ===\n")
+
+    results = []
+    progress = []      # one status line per destination, written in one go
+    for dest_info, outcome in zip(destinations[:top_n], outcomes):
+        if isinstance(outcome, Exception):
+            progress.append(f"Searching {origin} → {dest_info['destination']}... error — {outcome}")
+            continue
+        dest, dep, ret, flights = outcome
+        line = f"Searching {origin} → {dest} ({dep} to {ret})... "
+
+        if not flights:
+            progress.append(line + "no results")
+            continue
+
+        progress.append(line + f"${flights[0]['_price_f']:,.0f} CAD")
+        results.extend(summarize_offers(dest, flights))
+    sys.stdout.write("".join(line + "\n" for line in progress))
+    return results
+
+
+def print_summary(results, origin=ORIGIN, display_k=DISPLAY_K):
+    """Print the display_k cheapest result rows as a table."""
+    print(f"\n\n=== Summary: Cheapest Business Class from {origin} ===\n")
+    top = heapq.nsmallest(display_k, results, key=itemgetter("price"))
+
+    print(f"{'Dest':<6} {'Price':>10}  {'Airlines':<8} {'Stops':<6} {'Duration':<10} {'Route'}")
+    print("-" * 75)
+    sys.stdout.write("".join(
+        SUMMARY_ROW(r["dest"], r["price"], r["carriers"], r["stops"],
+                    r["duration"], r["route"]) + "\n"
+        for r in top
+    ))
+
+    print(f"\n=== Phase 1 complete — {len(results)} business class options found ===")
 
-    # Respect rate limit (10 req/sec)
-    time.sleep(0.2)
 
-# Summary sorted by price
-print(f"\n\n=== Summary: Cheapest Business Class from {ORIGIN} ===\n")
-results.sort(key=lambda x: x["price"])
+async def main():
+    results = await run_phase1()
+    if results is None:
+        print("No destinations returned. Check API credentials.")
+        raise SystemExit(1)
+    print_summary(results)
 
-print(f"{'Dest':<6} {'Price':>10}  {'Airlines':<8} {'Stops':<6} {'Duration':<10} {'Route'}")
-print("-" * 75)
-for r in results:
-    print(f"{r['dest']:<6} ${r['price']:>9,.0f}  {r['carriers']:<8} "
-          f"{r['stops']:<6} {r['duration']:<10} {r['route']}")
 
-print(f"\n=== Phase 1 complete — {len(results)} business class options found ===")
+if __name__ == "__main__":
+    asyncio.run(main())